@@ -0,0 +1,302 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import database
+
+# --- Constantes ---
+TAILLE_LOT = 50000
+SEUILS_ABC = (0.80, 0.95)
+EPOQUE_JULIENNE = 2440587.5  # julianday('1970-01-01')
+TAILLE_CACHE = 8             # périodes gardées en cache (les moins récemment utilisées sortent)
+
+_cache = OrderedDict()
+
+class DonneesVentes:
+    """Ventes d'une période (lignes ou agrégats par jour et par produit), stockées en colonnes NumPy."""
+    def __init__(self, jours, produits, quantites, montants, prix_achats, produit_ids, noms):
+        self.jours = jours                    # jours depuis 1970-01-01 (int64)
+        self.produits = produits              # index dans produit_ids (int64)
+        self.quantites = quantites
+        self.montants = montants
+        self.couts = quantites * prix_achats
+        self.produit_ids = produit_ids
+        self.noms = noms
+
+    @property
+    def nb_produits(self):
+        return len(self.produit_ids)
+
+    def __len__(self):
+        return len(self.jours)
+
+class _EntrepotLignes:
+    """
+    Copie en colonnes de toutes les lignes de vente, complétée au fil de l'eau :
+    seules les lignes dont l'id dépasse le dernier id chargé sont relues par lots.
+    Les années archivées sont lues depuis leurs agrégats par jour et par produit.
+    Les produits sont identifiés par un code entier attribué à leur id texte (jamais par
+    leur rowid, que SQLite réattribue après une suppression).
+    """
+    def __init__(self):
+        self.reinitialiser()
+
+    def reinitialiser(self):
+        self.dernier_id = 0
+        self.nb_lignes = 0
+        self.nb_archives = None  # années archivées lors du dernier chargement
+        self.codes = {}  # produit_id -> code entier
+        self.ids = []    # code entier -> produit_id
+        self.jours = np.empty(0, dtype=np.int64)
+        self.produits = np.empty(0, dtype=np.int64)
+        self.quantites = np.empty(0)
+        self.montants = np.empty(0)
+        self.agregats = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        self.empreinte_agregats = None
+
+    def _coder(self, produit_ids):
+        codes = self.codes
+        for produit_id in produit_ids:
+            if produit_id not in codes:
+                codes[produit_id] = len(self.ids)
+                self.ids.append(produit_id)
+        return np.fromiter((codes[p] for p in produit_ids), dtype=np.int64, count=len(produit_ids))
+
+    def colonnes(self):
+        """(jours, codes produit, quantites, montants) des lignes et des agrégats réunis."""
+        return tuple(np.concatenate([ligne, agregat]) for ligne, agregat in
+                     zip((self.jours, self.produits, self.quantites, self.montants), self.agregats))
+
+    def _synchroniser_agregats(self, cursor):
+        empreinte = cursor.execute("SELECT COUNT(*), TOTAL(quantite), TOTAL(chiffre_affaires) FROM Agregats_Ventes").fetchone()
+        if empreinte == self.empreinte_agregats:
+            return
+        lignes = cursor.execute(f"""
+            SELECT CAST(julianday(jour) - {EPOQUE_JULIENNE} AS INTEGER), produit_id, quantite, chiffre_affaires
+            FROM Agregats_Ventes
+        """).fetchall()
+        jours, produit_ids, quantites, montants = zip(*lignes) if lignes else ((), (), (), ())
+        self.agregats = (np.array(jours, dtype=np.int64), self._coder(produit_ids),
+                         np.array(quantites, dtype=np.float64), np.array(montants, dtype=np.float64))
+        self.empreinte_agregats = empreinte
+
+    def synchroniser(self, conn):
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        dernier_id, nb_lignes, nb_archives = cursor.execute(
+            "SELECT MAX(id), COUNT(*), (SELECT COUNT(*) FROM Archives) FROM Details_Vente").fetchone()
+        dernier_id = dernier_id or 0
+        # Une année archivée a quitté Details_Vente pour Agregats_Ventes : ses lignes encore en
+        # mémoire seraient comptées deux fois, même si de nouvelles ventes compensent le nombre de lignes.
+        if nb_archives != self.nb_archives or nb_lignes < self.nb_lignes or dernier_id < self.dernier_id:
+            self.reinitialiser()
+        self.nb_archives = nb_archives
+        # Borne haute lue avant les lignes : une vente validée entre-temps sera lue la fois suivante.
+        cursor.execute(f"""
+            SELECT CAST(julianday(V.date_vente) - {EPOQUE_JULIENNE} AS INTEGER),
+                   DV.produit_id, DV.quantite, DV.quantite * DV.prix_unitaire
+            FROM Details_Vente DV
+            JOIN Ventes V ON DV.vente_id = V.id
+            WHERE DV.id > ? AND DV.id <= ?
+        """, (self.dernier_id, dernier_id))
+        lots = [(self.jours, self.produits, self.quantites, self.montants)]
+        while True:
+            lot = cursor.fetchmany(TAILLE_LOT)
+            if not lot: break
+            jours, produit_ids, quantites, montants = zip(*lot)
+            lots.append((np.array(jours, dtype=np.int64), self._coder(produit_ids),
+                         np.array(quantites, dtype=np.float64), np.array(montants, dtype=np.float64)))
+        if len(lots) > 1:
+            self.jours, self.produits, self.quantites, self.montants = (np.concatenate(c) for c in zip(*lots))
+        self.dernier_id = max(self.dernier_id, dernier_id)
+        self.nb_lignes = nb_lignes
+        self._synchroniser_agregats(cursor)
+
+_entrepot = _EntrepotLignes()
+_verrou = threading.Lock()  # l'entrepôt et le cache sont partagés avec le thread de préchargement
+
+def _jour(d):
+    return (np.datetime64(d, 'D') - np.datetime64('1970-01-01', 'D')).astype(np.int64)
+
+def _lire_produits(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return {r[0]: r[1:] for r in cursor.execute("SELECT id, nom, COALESCE(prix_achat, 0) FROM Produits")}
+
+def _empreinte(conn, produits):
+    """
+    Empreinte bon marché des données : change dès qu'une vente est ajoutée, qu'une année est
+    archivée ou qu'un produit est ajouté, supprimé, renommé ou change de prix d'achat.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    ventes = cursor.execute("""
+        SELECT (SELECT MAX(id) FROM Ventes), (SELECT MAX(id) FROM Details_Vente), (SELECT COUNT(*) FROM Archives)
+    """).fetchone()
+    return ventes + (hash(tuple(produits.items())),)
+
+def charger_ventes(start_date=None, end_date=None, conn=None, produits=None):
+    """
+    Retourne les ventes de la période en colonnes. Comme les rapports existants,
+    les ventes des produits supprimés sont ignorées et le coût utilise le prix d'achat actuel.
+    """
+    fermer = conn is None
+    conn = conn or database.get_db_connection()
+    try:
+        _entrepot.synchroniser(conn)
+        if produits is None:
+            produits = _lire_produits(conn)
+    finally:
+        if fermer: conn.close()
+
+    jours, codes, quantites, montants = _entrepot.colonnes()
+    existants = [_entrepot.codes[p] for p in produits if p in _entrepot.codes]
+    masque = np.isin(codes, np.array(existants, dtype=np.int64))
+    if start_date and end_date:
+        masque &= (jours >= _jour(start_date)) & (jours <= _jour(end_date))
+
+    codes_utilises, index = np.unique(codes[masque], return_inverse=True)
+    index = index.astype(np.int64).ravel()
+    ids = [_entrepot.ids[c] for c in codes_utilises.tolist()]
+    return DonneesVentes(
+        jours=jours[masque], produits=index, quantites=quantites[masque], montants=montants[masque],
+        prix_achats=np.array([produits[i][1] for i in ids], dtype=np.float64)[index] if ids else np.zeros(0),
+        produit_ids=np.array(ids, dtype=object), noms=np.array([produits[i][0] for i in ids], dtype=object),
+    )
+
+# --- Calculs vectorisés ---
+def tendances(donnees, periode='jour'):
+    """Chiffre d'affaires et quantités par jour ou par semaine (lundi), périodes vides incluses."""
+    if not len(donnees):
+        return np.array([], dtype='datetime64[D]'), np.zeros(0), np.zeros(0)
+    if periode == 'semaine':
+        index = (donnees.jours + 3) // 7  # le 1970-01-01 était un jeudi
+        debuts = lambda i: i * 7 - 3
+    else:
+        index = donnees.jours
+        debuts = lambda i: i
+    premier = index.min()
+    index = index - premier
+    taille = int(index.max()) + 1
+    ca = np.bincount(index, weights=donnees.montants, minlength=taille)
+    quantites = np.bincount(index, weights=donnees.quantites, minlength=taille)
+    dates = debuts(np.arange(taille) + premier).astype('datetime64[D]')
+    return dates, ca, quantites
+
+def moyenne_mobile(valeurs, fenetre=7):
+    """Moyenne mobile simple ; les premières valeurs utilisent une fenêtre partielle."""
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    if not len(valeurs):
+        return valeurs
+    cumul = np.cumsum(np.insert(valeurs, 0, 0.0))
+    fin = np.arange(1, len(valeurs) + 1)
+    debut = np.maximum(fin - fenetre, 0)
+    return (cumul[fin] - cumul[debut]) / (fin - debut)
+
+def marge_par_produit(donnees):
+    """Chiffre d'affaires, coût, marge et taux de marge par produit."""
+    n = donnees.nb_produits
+    ca = np.bincount(donnees.produits, weights=donnees.montants, minlength=n)
+    couts = np.bincount(donnees.produits, weights=donnees.couts, minlength=n)
+    quantites = np.bincount(donnees.produits, weights=donnees.quantites, minlength=n)
+    marge = ca - couts
+    taux = np.divide(marge, ca, out=np.zeros(n), where=ca != 0)
+    return {'chiffre_affaires': ca, 'cout': couts, 'marge': marge, 'taux_marge': taux, 'quantite': quantites}
+
+def classification_abc(donnees, seuils=SEUILS_ABC):
+    """Classe A/B/C de chaque produit selon sa part cumulée du chiffre d'affaires."""
+    ca = np.bincount(donnees.produits, weights=donnees.montants, minlength=donnees.nb_produits)
+    total = ca.sum()
+    classes = np.full(len(ca), 'C', dtype='<U1')
+    if total <= 0:
+        return classes
+    ordre = np.argsort(-ca, kind='stable')
+    part_cumulee = np.cumsum(ca[ordre]) / total
+    # Un produit est classé selon la part cumulée *avant* lui : le premier produit est toujours A.
+    part_avant = part_cumulee - ca[ordre] / total
+    classes[ordre] = np.where(part_avant < seuils[0], 'A', np.where(part_avant < seuils[1], 'B', 'C'))
+    return classes
+
+def prevision_demande(donnees, horizon=7, fenetre=28, jour_fin=None):
+    """
+    Prévision de la quantité vendue par produit sur `horizon` jours,
+    par régression linéaire sur les `fenetre` derniers jours (tous produits en une passe).
+    """
+    n = donnees.nb_produits
+    if not len(donnees):
+        return np.zeros(n)
+    if jour_fin is None:
+        jour_fin = int(donnees.jours.max())
+    debut = jour_fin - fenetre + 1
+    masque = (donnees.jours >= debut) & (donnees.jours <= jour_fin)
+    matrice = np.bincount(
+        donnees.produits[masque] * fenetre + (donnees.jours[masque] - debut),
+        weights=donnees.quantites[masque], minlength=n * fenetre,
+    ).reshape(n, fenetre)
+
+    x = np.arange(fenetre, dtype=np.float64)
+    x_centre = x - x.mean()
+    pente = matrice @ x_centre / (x_centre @ x_centre)
+    moyenne = matrice.mean(axis=1)
+    futur = np.arange(fenetre, fenetre + horizon) - x.mean()
+    prevision = moyenne[:, None] + pente[:, None] * futur[None, :]
+    return np.clip(prevision, 0, None).sum(axis=1)
+
+# --- Point d'entrée avec cache ---
+def analyser(start_date=None, end_date=None, horizon=7, fenetre_moyenne=7):
+    """
+    Calcule toutes les analyses d'une période. Le résultat est mis en cache par période
+    et recalculé seulement si les ventes ou les prix d'achat ont changé.
+    """
+    with _verrou:
+        conn = database.get_db_connection()
+        try:
+            cle = (start_date, end_date, horizon, fenetre_moyenne)
+            produits = _lire_produits(conn)
+            empreinte = _empreinte(conn, produits)
+            en_cache = _cache.get(cle)
+            if en_cache and en_cache[0] == empreinte:
+                _cache.move_to_end(cle)
+                return en_cache[1]
+            donnees = charger_ventes(start_date, end_date, conn=conn, produits=produits)
+        finally:
+            conn.close()
+
+    jours, ca_jour, quantites_jour = tendances(donnees, 'jour')
+    semaines, ca_semaine, quantites_semaine = tendances(donnees, 'semaine')
+    marges = marge_par_produit(donnees)
+    resultat = {
+        'produit_ids': donnees.produit_ids,
+        'noms': donnees.noms,
+        'jours': jours,
+        'ca_jour': ca_jour,
+        'quantites_jour': quantites_jour,
+        'moyenne_mobile_ca': moyenne_mobile(ca_jour, fenetre_moyenne),
+        'semaines': semaines,
+        'ca_semaine': ca_semaine,
+        'quantites_semaine': quantites_semaine,
+        'classes_abc': classification_abc(donnees),
+        'marges': marges,
+        'prevision': prevision_demande(donnees, horizon=horizon),
+    }
+    with _verrou:
+        _cache[cle] = (empreinte, resultat)
+        _cache.move_to_end(cle)
+        while len(_cache) > TAILLE_CACHE:
+            _cache.popitem(last=False)
+    return resultat
+
+def prechauffer():
+    """Charge l'historique dans l'entrepôt (à lancer dans un thread au démarrage de l'application)."""
+    with _verrou:
+        conn = database.get_db_connection()
+        try:
+            _entrepot.synchroniser(conn)
+        finally:
+            conn.close()
+
+def vider_cache():
+    with _verrou:
+        _cache.clear()
+        _entrepot.reinitialiser()
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import hashlib
+import json
+from datetime import date, datetime
+
+from aiohttp import web
+
+import database
+
+# --- Constantes ---
+TAILLE_PAGE = 50
+TAILLE_PAGE_MAX = 500
+TAILLE_POOL = 4
+
+# --- Utilitaires ---
+def _json_defaut(valeur):
+    if isinstance(valeur, (datetime, date)):
+        return valeur.isoformat()
+    raise TypeError(f"Type non sérialisable : {type(valeur).__name__}")
+
+def _reponse_json(request, donnees):
+    """Réponse JSON avec ETag : renvoie 304 sans corps si le client a déjà cette version."""
+    corps = json.dumps(donnees, default=_json_defaut, ensure_ascii=False).encode('utf-8')
+    etag = '"' + hashlib.sha1(corps).hexdigest() + '"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers={'ETag': etag})
+    return web.Response(body=corps, content_type='application/json', charset='utf-8',
+                        headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+def _pagination(request):
+    try:
+        page = max(int(request.query.get('page', 1)), 1)
+        taille = min(max(int(request.query.get('taille', TAILLE_PAGE)), 1), TAILLE_PAGE_MAX)
+    except ValueError:
+        raise web.HTTPBadRequest(text="'page' et 'taille' doivent être des entiers.")
+    return page, taille
+
+def _date(request, nom):
+    valeur = request.query.get(nom)
+    if not valeur:
+        return None
+    try:
+        return date.fromisoformat(valeur)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"'{nom}' doit être une date AAAA-MM-JJ.")
+
+def _page(lignes, page, taille):
+    # Une ligne de plus a été lue pour savoir s'il existe une page suivante, sans COUNT(*).
+    return {'page': page, 'taille': taille, 'suivante': len(lignes) > taille,
+            'elements': [dict(ligne) for ligne in lignes[:taille]]}
+
+async def _executer(request, fonction, *args, **kwargs):
+    """Exécute un helper de `database` dans un thread, avec une connexion du pool."""
+    pool = request.app['pool']
+    def appel():
+        with pool.connexion() as conn:
+            return fonction(*args, conn=conn, **kwargs)
+    return await asyncio.to_thread(appel)
+
+# --- Routes ---
+routes = web.RouteTableDef()
+
+@routes.get('/produits')
+async def produits(request):
+    page, taille = _pagination(request)
+    lignes = await _executer(request, database.lister_produits, request.query.get('recherche', ''),
+                             limite=taille + 1, decalage=(page - 1) * taille)
+    return _reponse_json(request, _page(lignes, page, taille))
+
+@routes.get('/produits/{code}')
+async def produit(request):
+    ligne = await _executer(request, database.trouver_produit_par_code, request.match_info['code'])
+    if ligne is None:
+        raise web.HTTPNotFound(text="Produit introuvable.")
+    return _reponse_json(request, dict(ligne))
+
+@routes.get('/clients')
+async def clients(request):
+    page, taille = _pagination(request)
+    lignes = await _executer(request, database.lister_clients, limite=taille + 1, decalage=(page - 1) * taille)
+    return _reponse_json(request, _page(lignes, page, taille))
+
+@routes.get('/ventes')
+async def ventes(request):
+    page, taille = _pagination(request)
+    lignes = await _executer(request, database.lister_ventes, _date(request, 'date'),
+                             limite=taille + 1, decalage=(page - 1) * taille)
+    return _reponse_json(request, _page(lignes, page, taille))
+
+@routes.get('/ventes/{vente_id:\\d+}')
+async def vente(request):
+    entete, lignes = await _executer(request, database.get_vente, int(request.match_info['vente_id']))
+    if entete is None:
+        raise web.HTTPNotFound(text="Vente introuvable.")
+    return _reponse_json(request, dict(entete, lignes=[dict(ligne) for ligne in lignes]))
+
+@routes.get('/rapports')
+async def rapports(request):
+    debut, fin = _date(request, 'debut'), _date(request, 'fin')
+    if bool(debut) != bool(fin):
+        raise web.HTTPBadRequest(text="'debut' et 'fin' vont ensemble.")
+    chiffre_affaires, benefice, meilleures_ventes, par_vendeur = await asyncio.gather(
+        _executer(request, database.get_total_revenue, debut, fin),
+        _executer(request, database.get_total_profit, debut, fin),
+        _executer(request, database.get_best_selling_products, debut, fin),
+        _executer(request, database.get_ventes_par_vendeur, debut, fin),
+    )
+    return _reponse_json(request, {
+        'debut': debut, 'fin': fin, 'chiffre_affaires': chiffre_affaires, 'benefice': benefice,
+        'meilleures_ventes': [dict(ligne) for ligne in meilleures_ventes],
+        'par_vendeur': [dict(ligne) for ligne in par_vendeur],
+    })
+
+# --- Application ---
+def creer_application(taille_pool=TAILLE_POOL):
+    database.initialiser_db()
+    app = web.Application()
+    app['pool'] = database.PoolConnexions(taille_pool)
+    app.add_routes(routes)
+
+    async def fermer_pool(app):
+        app['pool'].fermer()
+    app.on_cleanup.append(fermer_pool)
+    return app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="API HTTP/JSON en lecture seule sur la base des ventes.")
+    parser.add_argument('--hote', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pool', type=int, default=TAILLE_POOL, help="nombre de connexions SQLite")
+    args = parser.parse_args()
+    web.run_app(creer_application(args.pool), host=args.hote, port=args.port)
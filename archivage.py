@@ -0,0 +1,128 @@
+import argparse
+import os
+import sqlite3
+from datetime import date
+
+import database
+
+# --- Constantes ---
+DOSSIER_ARCHIVES = os.environ.get('GESTION_VENTES_ARCHIVES', os.path.join(os.path.dirname(database.DB_PATH), 'archives'))
+
+def chemin_archive(annee, dossier=DOSSIER_ARCHIVES):
+    return os.path.join(dossier, f"ventes_{annee}.db")
+
+def _creer_schema_archive(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS archive.Ventes (
+        id INTEGER PRIMARY KEY, date_vente TIMESTAMP, total REAL NOT NULL, client_id INTEGER, user_id INTEGER
+    );""")
+    # Archives créées avant l'enregistrement du vendeur
+    if 'user_id' not in {row[1] for row in cursor.execute("PRAGMA archive.table_info(Ventes)")}:
+        cursor.execute("ALTER TABLE archive.Ventes ADD COLUMN user_id INTEGER")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS archive.Details_Vente (
+        id INTEGER PRIMARY KEY, vente_id INTEGER NOT NULL, produit_id TEXT NOT NULL,
+        quantite INTEGER NOT NULL, prix_unitaire REAL NOT NULL
+    );""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_details_vente_vente ON Details_Vente(vente_id)")
+
+def archiver_annee(annee, dossier=DOSSIER_ARCHIVES):
+    """
+    Déplace les ventes d'un exercice clos dans son propre fichier SQLite et conserve dans la
+    base principale les agrégats par jour et par produit utilisés par les rapports.
+    Les années doivent être archivées dans l'ordre. Retourne le nombre de ventes archivées.
+    """
+    if annee >= date.today().year:
+        raise ValueError(f"L'exercice {annee} n'est pas clos.")
+    debut, fin = f"{annee}-01-01", f"{annee + 1}-01-01"
+    chemin = chemin_archive(annee, dossier)
+    os.makedirs(dossier, exist_ok=True)
+
+    conn = sqlite3.connect(database.DB_PATH, isolation_level=None)
+    try:
+        if conn.execute("SELECT 1 FROM Ventes WHERE date_vente < ? LIMIT 1", (debut,)).fetchone():
+            raise ValueError(f"Des ventes antérieures à {annee} ne sont pas archivées : archivez d'abord ces années.")
+        conn.execute("ATTACH DATABASE ? AS archive", (chemin,))
+        cursor = conn.cursor()
+
+        # 1. Copie dans l'archive, validée seule : si l'étape 2 échoue, relancer l'archivage
+        #    recopie sans doublon (INSERT OR IGNORE) et rien n'est perdu.
+        cursor.execute("BEGIN IMMEDIATE")
+        _creer_schema_archive(cursor)
+        cursor.execute("""
+            INSERT OR IGNORE INTO archive.Ventes (id, date_vente, total, client_id, user_id)
+            SELECT id, date_vente, total, client_id, user_id FROM main.Ventes
+            WHERE date_vente >= ? AND date_vente < ?
+        """, (debut, fin))
+        cursor.execute("""
+            INSERT OR IGNORE INTO archive.Details_Vente (id, vente_id, produit_id, quantite, prix_unitaire)
+            SELECT DV.id, DV.vente_id, DV.produit_id, DV.quantite, DV.prix_unitaire
+            FROM main.Details_Vente DV JOIN main.Ventes V ON DV.vente_id = V.id
+            WHERE V.date_vente >= ? AND V.date_vente < ?
+        """, (debut, fin))
+        cursor.execute("COMMIT")
+
+        # 2. Agrégats et suppression dans la base principale, en une transaction.
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            INSERT INTO Agregats_Ventes (jour, produit_id, quantite, chiffre_affaires)
+            SELECT DATE(V.date_vente), DV.produit_id, SUM(DV.quantite), SUM(DV.quantite * DV.prix_unitaire)
+            FROM Details_Vente DV JOIN Ventes V ON DV.vente_id = V.id
+            WHERE V.date_vente >= ? AND V.date_vente < ?
+            GROUP BY DATE(V.date_vente), DV.produit_id
+            ON CONFLICT (jour, produit_id) DO UPDATE SET
+                quantite = quantite + excluded.quantite,
+                chiffre_affaires = chiffre_affaires + excluded.chiffre_affaires
+        """, (debut, fin))
+        cursor.execute("""
+            INSERT INTO Agregats_Ventes_Jour (jour, nb_ventes, total)
+            SELECT DATE(date_vente), COUNT(*), SUM(total) FROM Ventes
+            WHERE date_vente >= ? AND date_vente < ?
+            GROUP BY DATE(date_vente)
+            ON CONFLICT (jour) DO UPDATE SET
+                nb_ventes = nb_ventes + excluded.nb_ventes, total = total + excluded.total
+        """, (debut, fin))
+        cursor.execute("""
+            INSERT INTO Agregats_Ventes_Vendeur (jour, user_id, nb_ventes, total)
+            SELECT DATE(date_vente), COALESCE(user_id, 0), COUNT(*), SUM(total) FROM Ventes
+            WHERE date_vente >= ? AND date_vente < ?
+            GROUP BY DATE(date_vente), COALESCE(user_id, 0)
+            ON CONFLICT (jour, user_id) DO UPDATE SET
+                nb_ventes = nb_ventes + excluded.nb_ventes, total = total + excluded.total
+        """, (debut, fin))
+        cursor.execute("""
+            DELETE FROM Details_Vente WHERE vente_id IN (
+                SELECT id FROM Ventes WHERE date_vente >= ? AND date_vente < ?)
+        """, (debut, fin))
+        nb_ventes = cursor.execute("DELETE FROM Ventes WHERE date_vente >= ? AND date_vente < ?", (debut, fin)).rowcount
+        id_min, id_max, total_archive = cursor.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM archive.Ventes").fetchone()
+        cursor.execute("""
+            INSERT INTO Archives (annee, chemin, id_min, id_max, nb_ventes) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (annee) DO UPDATE SET
+                chemin = excluded.chemin, id_min = excluded.id_min, id_max = excluded.id_max, nb_ventes = excluded.nb_ventes
+        """, (annee, chemin, id_min, id_max, total_archive))
+        cursor.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return nb_ventes
+
+def archiver_jusqua(annee, dossier=DOSSIER_ARCHIVES):
+    """Archive, dans l'ordre, toutes les années encore dans la base principale jusqu'à `annee` incluse."""
+    conn = database.get_db_connection()
+    premiere = conn.execute("SELECT MIN(strftime('%Y', date_vente)) as annee FROM Ventes").fetchone()['annee']
+    conn.close()
+    if premiere is None:
+        return {}
+    return {a: archiver_annee(a, dossier) for a in range(int(premiere), annee + 1)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archive les ventes des exercices clos dans des fichiers annuels.")
+    parser.add_argument('annee', type=int, help="dernière année à archiver (les années antérieures le sont aussi)")
+    args = parser.parse_args()
+    database.initialiser_db()
+    for annee, nb_ventes in archiver_jusqua(args.annee).items():
+        print(f"{annee} : {nb_ventes} ventes archivées dans {chemin_archive(annee)}")
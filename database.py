@@ -1,26 +1,26 @@
+import os
+import queue
+import random
 import sqlite3
+import string
+from contextlib import closing, contextmanager
+from datetime import datetime
+
 import bcrypt
 
-def initialiser_db():
-    """
-    Initialise la base de données et crée les tables si elles n'existent pas.
-    Gère également les migrations de schéma (ajout de colonnes).
-    """
-    conn = sqlite3.connect('gestion_ventes.db')
-    cursor = conn.cursor()
+# Chemin de la base, configurable pour faire tourner plusieurs boutiques ou des tests sur une copie.
+DB_PATH = os.environ.get('GESTION_VENTES_DB', 'gestion_ventes.db')
 
-    # --- Migrations ---
-    try:
-        cursor.execute("ALTER TABLE Produits ADD COLUMN prix_achat REAL DEFAULT 0")
-        conn.commit()
-    except sqlite3.OperationalError: pass # Colonne déjà existante
+# --- Migrations ---
+# Chaque migration fait passer le schéma de la version N à N+1 ; la version courante
+# est stockée dans PRAGMA user_version. Pour faire évoluer le schéma, ajouter une
+# fonction à la fin de MIGRATIONS (ne jamais modifier une migration déjà livrée).
 
-    try:
-        cursor.execute("ALTER TABLE Clients ADD COLUMN bonus_points INTEGER DEFAULT 0")
-        conn.commit()
-    except sqlite3.OperationalError: pass # Colonne déjà existante
+def _colonnes(cursor, table):
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
 
-    # --- Création des tables ---
+def _migration_schema_initial(cursor):
+    """Tables de base, colonnes ajoutées après coup et admin par défaut."""
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS Produits (
         id TEXT PRIMARY KEY, nom TEXT NOT NULL UNIQUE, description TEXT,
@@ -51,6 +51,12 @@ def initialiser_db():
         role TEXT NOT NULL CHECK(role IN ('admin', 'vendeur'))
     );""")
 
+    # Bases créées avant l'ajout de ces colonnes
+    if 'prix_achat' not in _colonnes(cursor, 'Produits'):
+        cursor.execute("ALTER TABLE Produits ADD COLUMN prix_achat REAL DEFAULT 0")
+    if 'bonus_points' not in _colonnes(cursor, 'Clients'):
+        cursor.execute("ALTER TABLE Clients ADD COLUMN bonus_points INTEGER DEFAULT 0")
+
     # --- Création de l'admin par défaut ---
     cursor.execute("SELECT * FROM Utilisateurs WHERE role = 'admin'")
     if not cursor.fetchone():
@@ -58,15 +64,216 @@ def initialiser_db():
         cursor.execute("INSERT INTO Utilisateurs (username, password, role) VALUES (?, ?, ?)",
                        ("admin", hashed_password, 'admin'))
 
-    conn.commit()
-    conn.close()
+def _migration_code_barre(cursor):
+    """Code-barres / SKU des produits, unique (plusieurs produits peuvent ne pas en avoir)."""
+    cursor.execute("ALTER TABLE Produits ADD COLUMN code_barre TEXT")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_produits_code_barre ON Produits(code_barre)")
+
+def _migration_archives(cursor):
+    """Années archivées dans des fichiers séparés et agrégats conservés dans la base principale."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Archives (
+        annee INTEGER PRIMARY KEY, chemin TEXT NOT NULL,
+        id_min INTEGER, id_max INTEGER, nb_ventes INTEGER NOT NULL DEFAULT 0,
+        date_archivage TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Agregats_Ventes (
+        jour TEXT NOT NULL, produit_id TEXT NOT NULL,
+        quantite INTEGER NOT NULL, chiffre_affaires REAL NOT NULL,
+        PRIMARY KEY (jour, produit_id)
+    );""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Agregats_Ventes_Jour (
+        jour TEXT PRIMARY KEY, nb_ventes INTEGER NOT NULL, total REAL NOT NULL
+    );""")
+
+def _migration_permissions(cursor):
+    """Capacités de chaque rôle et vendeur de chaque vente (NULL pour les ventes plus anciennes)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Permissions (
+        role TEXT NOT NULL, capacite TEXT NOT NULL,
+        PRIMARY KEY (role, capacite)
+    ) WITHOUT ROWID;""")
+    cursor.executemany("INSERT OR IGNORE INTO Permissions (role, capacite) VALUES (?, ?)",
+                       [('admin', 'enregistrer_ventes'), ('admin', 'gerer_produits'), ('admin', 'gerer_clients'),
+                        ('admin', 'gerer_utilisateurs'), ('admin', 'consulter_rapports'),
+                        ('vendeur', 'enregistrer_ventes')])
+    cursor.execute("ALTER TABLE Ventes ADD COLUMN user_id INTEGER REFERENCES Utilisateurs(id)")
+    # Index couvrant pour le rapport par vendeur : pas de lecture de la table.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventes_user ON Ventes(user_id, date_vente, total)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Agregats_Ventes_Vendeur (
+        jour TEXT NOT NULL, user_id INTEGER NOT NULL, nb_ventes INTEGER NOT NULL, total REAL NOT NULL,
+        PRIMARY KEY (jour, user_id)
+    );""")
+    # Années déjà archivées : leurs ventes n'ont pas de vendeur connu.
+    cursor.execute("INSERT OR IGNORE INTO Agregats_Ventes_Vendeur (jour, user_id, nb_ventes, total) SELECT jour, 0, nb_ventes, total FROM Agregats_Ventes_Jour")
+
+def _migration_version_permissions(cursor):
+    """Compteur incrémenté par trigger à chaque écriture dans Utilisateurs ou Permissions."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Version_Permissions (
+        id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL
+    );""")
+    cursor.execute("INSERT OR IGNORE INTO Version_Permissions (id, version) VALUES (1, 0)")
+    for table in ('Utilisateurs', 'Permissions'):
+        for evenement in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_version_permissions_{table.lower()}_{evenement.lower()}
+            AFTER {evenement} ON {table}
+            BEGIN UPDATE Version_Permissions SET version = version + 1 WHERE id = 1; END;""")
+
+MIGRATIONS = [
+    _migration_schema_initial,
+    _migration_code_barre,
+    _migration_archives,
+    _migration_permissions,
+    _migration_version_permissions,
+]
+
+def initialiser_db():
+    """
+    Met le schéma de la base à jour en appliquant les migrations manquantes.
+    Sur une base déjà à jour, seul PRAGMA user_version est lu.
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+            return
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Relu sous verrou : une autre caisse a pu migrer entre-temps.
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            for numero, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {numero}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
 
 def get_db_connection():
     """Crée et retourne une connexion à la base de données."""
-    conn = sqlite3.connect('gestion_ventes.db', detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
     conn.row_factory = sqlite3.Row
     return conn
 
+@contextmanager
+def _connexion(conn=None):
+    """Utilise la connexion fournie (ex. celle d'un pool) ou en ouvre une le temps de l'appel."""
+    if conn is not None:
+        yield conn
+        return
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+class PoolConnexions:
+    """
+    Connexions en lecture seule réutilisées entre les requêtes (API). La base passe en
+    mode WAL : les lecteurs ne bloquent pas les caisses qui écrivent, et inversement.
+    """
+    def __init__(self, taille=4):
+        self._libres = queue.LifoQueue()
+        self._toutes = [self._ouvrir() for _ in range(taille)]
+        for conn in self._toutes:
+            self._libres.put(conn)
+
+    @staticmethod
+    def _ouvrir():
+        conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def connexion(self):
+        conn = self._libres.get()
+        try:
+            yield conn
+        finally:
+            self._libres.put(conn)
+
+    def fermer(self):
+        for conn in self._toutes:
+            conn.close()
+
+# --- Permissions ---
+class PermissionRefusee(PermissionError):
+    """Action interdite à l'utilisateur connecté, ou aucun utilisateur connecté."""
+
+class Session:
+    """
+    Utilisateur connecté et capacités de son rôle, chargées une fois à l'ouverture.
+    Chaque vérification relit seulement le compteur Version_Permissions (une ligne, sur une
+    connexion gardée ouverte) : les capacités sont rechargées dès qu'un utilisateur ou une
+    permission change, y compris depuis une autre caisse.
+    """
+    def __init__(self, user):
+        self.user_id = user['id']
+        self.username = user['username']
+        self.role = user['role']
+        self.capacites = frozenset()
+        self.version = None
+        self._conn = sqlite3.connect(DB_PATH)
+        self._conn.row_factory = sqlite3.Row
+
+    def _version(self):
+        return self._conn.execute("SELECT version FROM Version_Permissions WHERE id = 1").fetchone()[0]
+
+    def _charger(self):
+        self.version = self._version()
+        lignes = self._conn.execute("""
+            SELECT U.role, P.capacite FROM Utilisateurs U
+            LEFT JOIN Permissions P ON P.role = U.role
+            WHERE U.id = ?
+        """, (self.user_id,)).fetchall()
+        # Utilisateur supprimé entre-temps : plus aucune capacité.
+        self.role = lignes[0]['role'] if lignes else None
+        self.capacites = frozenset(l['capacite'] for l in lignes if l['capacite'])
+
+    def peut(self, capacite):
+        if self._version() != self.version:
+            self._charger()
+        return capacite in self.capacites
+
+    def fermer(self):
+        self._conn.close()
+
+_session = None
+
+def ouvrir_session(user):
+    """Ouvre la session de l'utilisateur authentifié (ligne de verifier_utilisateur) et la retourne."""
+    global _session
+    fermer_session()
+    _session = Session(user)
+    _session._charger()
+    return _session
+
+def fermer_session():
+    global _session
+    if _session is not None:
+        _session.fermer()
+    _session = None
+
+def session_courante():
+    return _session
+
+def verifier_permission(capacite):
+    """Lève PermissionRefusee si l'utilisateur connecté n'a pas la capacité demandée."""
+    if _session is None:
+        raise PermissionRefusee("Aucun utilisateur connecté.")
+    if not _session.peut(capacite):
+        raise PermissionRefusee(f"Action non autorisée pour le rôle '{_session.role}'.")
+
 def verifier_utilisateur(username, password):
     """Vérifie les identifiants de l'utilisateur et retourne ses informations s'ils sont corrects."""
     conn = get_db_connection()
@@ -78,6 +285,7 @@ def verifier_utilisateur(username, password):
 
 def lister_utilisateurs():
     """Retourne la liste de tous les utilisateurs."""
+    verifier_permission('gerer_utilisateurs')
     conn = get_db_connection()
     users = conn.execute("SELECT id, username, role FROM Utilisateurs ORDER BY username").fetchall()
     conn.close()
@@ -85,6 +293,7 @@ def lister_utilisateurs():
 
 def ajouter_utilisateur(username, password, role):
     """Ajoute un nouvel utilisateur avec un mot de passe haché."""
+    verifier_permission('gerer_utilisateurs')
     conn = get_db_connection()
     try:
         hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
@@ -97,25 +306,27 @@ def ajouter_utilisateur(username, password, role):
     finally:
         conn.close()
 
+def _trouver_ou_creer_client(cursor, nom, contact):
+    """Id du client (nom, contact), inséré s'il n'existe pas ; ne valide pas la transaction."""
+    nom_formate = nom.title()
+    client = cursor.execute("SELECT id FROM Clients WHERE nom = ? AND contact = ?", (nom_formate, contact)).fetchone()
+    if client:
+        return client[0]
+    cursor.execute("INSERT INTO Clients (nom, contact, bonus_points) VALUES (?, ?, ?)", (nom_formate, contact, 0))
+    return cursor.lastrowid
+
 def find_or_create_client(nom, contact):
     """Cherche un client par nom et contact. S'il n'existe pas, le crée."""
+    verifier_permission('gerer_clients')
     conn = get_db_connection()
-    nom_formate = nom.title()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM Clients WHERE nom = ? AND contact = ?", (nom_formate, contact))
-    client = cursor.fetchone()
-    if client:
-        conn.close()
-        return client['id']
-    else:
-        cursor.execute("INSERT INTO Clients (nom, contact, bonus_points) VALUES (?, ?, ?)", (nom_formate, contact, 0))
-        new_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return new_id
+    client_id = _trouver_ou_creer_client(conn.cursor(), nom, contact)
+    conn.commit()
+    conn.close()
+    return client_id
 
 def modifier_client(client_id, nom, contact):
     """Modifie un client existant."""
+    verifier_permission('gerer_clients')
     conn = get_db_connection()
     conn.execute("UPDATE Clients SET nom = ?, contact = ? WHERE id = ?", (nom.title(), contact, client_id))
     conn.commit()
@@ -123,18 +334,12 @@ def modifier_client(client_id, nom, contact):
 
 def supprimer_client(client_id):
     """Supprime un client."""
+    verifier_permission('gerer_clients')
     conn = get_db_connection()
     conn.execute("DELETE FROM Clients WHERE id = ?", (client_id,))
     conn.commit()
     conn.close()
 
-def incrementer_points_bonus(client_id):
-    """Incrémente les points de bonus d'un client."""
-    conn = get_db_connection()
-    conn.execute("UPDATE Clients SET bonus_points = bonus_points + 1 WHERE id = ?", (client_id,))
-    conn.commit()
-    conn.close()
-
 def get_client_contact(client_id):
     """Récupère le contact d'un client par son ID."""
     conn = get_db_connection()
@@ -142,5 +347,262 @@ def get_client_contact(client_id):
     conn.close()
     return contact['contact'] if contact else None
 
+# --- Routage entre la base principale et les archives annuelles ---
+def _annees_archivees(conn, start_date=None, end_date=None):
+    query = "SELECT annee, chemin FROM Archives"
+    params = []
+    if start_date and end_date:
+        query += " WHERE annee BETWEEN ? AND ?"
+        params.extend([start_date.year, end_date.year])
+    return conn.execute(query + " ORDER BY annee DESC", params).fetchall()
+
+def _partitions(conn, start_date=None, end_date=None):
+    """
+    Routeur : donne les schémas à interroger pour une période, des ventes les plus récentes
+    aux plus anciennes. 'main' n'est sauté que si toute la période est archivée ; chaque
+    archive utile est attachée le temps d'être lue, puis détachée.
+    """
+    archives = _annees_archivees(conn, start_date, end_date)
+    annees = {a['annee'] for a in archives}
+    if not (start_date and end_date) or any(annee not in annees for annee in range(start_date.year, end_date.year + 1)):
+        yield 'main'
+    for archive in archives:
+        schema = f"archive_{archive['annee']}"
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (archive['chemin'],))
+        try:
+            yield schema
+        finally:
+            conn.execute(f"DETACH DATABASE {schema}")
+
+def _filtre_jours(colonne, start_date, end_date):
+    """Clause WHERE sur une période (vide si aucune période)."""
+    if start_date and end_date:
+        return f" WHERE {colonne} BETWEEN ? AND ?", [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")]
+    return "", []
+
+def _pagination(query, params, limite, decalage):
+    if limite is not None:
+        query += " LIMIT ? OFFSET ?"
+        params = list(params) + [limite, decalage]
+    return query, params
+
+def lister_produits(search_term="", limite=None, decalage=0, conn=None):
+    with _connexion(conn) as conn:
+        query, params = _pagination("SELECT * FROM Produits WHERE nom LIKE ? ORDER BY nom", ['%' + search_term + '%'], limite, decalage)
+        return conn.execute(query, params).fetchall()
+
+def lister_produits_en_stock(search_term=""):
+    conn = get_db_connection()
+    query = "SELECT * FROM Produits WHERE quantite_stock > 0 AND nom LIKE ? ORDER BY nom"
+    produits = conn.execute(query, ('%' + search_term + '%',)).fetchall()
+    conn.close()
+    return produits
+
+def trouver_produit_par_code(code, conn=None):
+    """Recherche exacte par code-barres ou par id produit (SKU), via index."""
+    with _connexion(conn) as conn:
+        return conn.execute("SELECT * FROM Produits WHERE code_barre = ? OR id = ?", (code, code)).fetchone()
+
+def ajouter_produit(nom, desc, prix_achat, prix_vente, stock, code_barre=None):
+    verifier_permission('gerer_produits')
+    conn = get_db_connection()
+    try:
+        conn.execute("INSERT INTO Produits (id, nom, description, prix_achat, prix_vente, quantite_stock, code_barre) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     ('PROD-' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=4)), nom.capitalize(), desc, prix_achat, prix_vente, stock, code_barre or None))
+        conn.commit()
+        return True
+    except sqlite3.IntegrityError: # Nom ou code-barres déjà utilisé
+        return False
+    finally:
+        conn.close()
+
+def modifier_produit(produit_id, nom, desc, prix_achat, prix_vente, stock, code_barre=None):
+    verifier_permission('gerer_produits')
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE Produits SET nom = ?, description = ?, prix_achat = ?, prix_vente = ?, quantite_stock = ?, code_barre = ? WHERE id = ?",
+                     (nom.capitalize(), desc, prix_achat, prix_vente, stock, code_barre or None, produit_id))
+        conn.commit()
+        return True
+    except sqlite3.IntegrityError: # Nom ou code-barres déjà utilisé
+        return False
+    finally:
+        conn.close()
+
+def supprimer_produit(produit_id):
+    verifier_permission('gerer_produits')
+    conn = get_db_connection()
+    conn.execute("DELETE FROM Produits WHERE id = ?", (produit_id,))
+    conn.commit()
+    conn.close()
+
+def lister_clients(limite=None, decalage=0, conn=None):
+    with _connexion(conn) as conn:
+        query, params = _pagination("SELECT * FROM Clients ORDER BY nom", [], limite, decalage)
+        return conn.execute(query, params).fetchall()
+
+def lister_ventes(filter_date=None, limite=None, decalage=0, conn=None):
+    query = """
+        SELECT V.id, V.date_vente, V.total, C.nom as client_nom
+        FROM {schema}.Ventes V
+        LEFT JOIN main.Clients C ON V.client_id = C.id
+    """
+    params = []
+    if filter_date:
+        query += " WHERE DATE(V.date_vente) = ?"
+        params.append(filter_date.strftime("%Y-%m-%d"))
+    
+    query += " ORDER BY V.date_vente DESC"
+    
+    # Les partitions sont disjointes et parcourues de la plus récente à la plus ancienne :
+    # on s'arrête dès que la page demandée est remplie.
+    ventes = []
+    with _connexion(conn) as conn:
+        with closing(_partitions(conn, filter_date, filter_date)) as partitions:
+            for schema in partitions:
+                reste = None if limite is None else decalage + limite - len(ventes)
+                q, p = _pagination(query.format(schema=schema), params, reste, 0)
+                ventes.extend(conn.execute(q, p).fetchall())
+                if reste is not None and len(ventes) >= decalage + limite:
+                    break
+    return ventes[decalage:] if limite is None else ventes[decalage:decalage + limite]
+
+def _lire_vente(conn, schema, vente_id):
+    vente = conn.execute(f"""
+        SELECT V.id, V.date_vente, V.total, V.client_id, C.nom as client_nom
+        FROM {schema}.Ventes V
+        LEFT JOIN main.Clients C ON V.client_id = C.id
+        WHERE V.id = ?
+    """, (vente_id,)).fetchone()
+    if vente is None:
+        return None, []
+    lignes = conn.execute(f"""
+        SELECT DV.produit_id, P.nom, DV.quantite, DV.prix_unitaire
+        FROM {schema}.Details_Vente DV
+        LEFT JOIN main.Produits P ON DV.produit_id = P.id
+        WHERE DV.vente_id = ?
+        ORDER BY DV.id
+    """, (vente_id,)).fetchall()
+    return vente, lignes
+
+def get_vente(vente_id, conn=None):
+    """Retourne la vente et ses lignes, ou (None, []) si elle n'existe pas."""
+    with _connexion(conn) as conn:
+        vente, lignes = _lire_vente(conn, 'main', vente_id)
+        if vente is not None:
+            return vente, lignes
+        # Sinon, seule l'archive dont la plage d'ids contient la vente est ouverte.
+        archive = conn.execute("SELECT annee, chemin FROM Archives WHERE ? BETWEEN id_min AND id_max", (vente_id,)).fetchone()
+        if archive is None:
+            return None, []
+        conn.execute("ATTACH DATABASE ? AS archive", (archive['chemin'],))
+        try:
+            return _lire_vente(conn, 'archive', vente_id)
+        finally:
+            conn.execute("DETACH DATABASE archive")
+
+def enregistrer_vente(panier, client=None, conn=None):
+    """
+    Enregistre la vente d'un Panier au nom de l'utilisateur connecté et décrémente le stock en base.
+    `client` = (nom, contact) retrouve ou crée le client et, si un contact est donné, lui ajoute
+    un point de fidélité, le tout dans la transaction de la vente.
+    Retourne l'id de la vente, ou None (rien n'est enregistré) si le stock ne suffit plus.
+    Une connexion fournie peut déjà tenir le verrou d'écriture (BEGIN IMMEDIATE).
+    """
+    verifier_permission('enregistrer_ventes')
+    with _connexion(conn) as conn:
+        heure_de_vente = datetime.now()
+        
+        cursor = conn.cursor()
+        client_id = None
+        if client:
+            nom, contact = client
+            client_id = _trouver_ou_creer_client(cursor, nom, contact)
+            if contact:
+                cursor.execute("UPDATE Clients SET bonus_points = bonus_points + 1 WHERE id = ?", (client_id,))
+        cursor.execute("INSERT INTO Ventes (date_vente, total, client_id, user_id) VALUES (?, ?, ?, ?)",
+                       (heure_de_vente, panier.total, client_id, _session.user_id))
+        vente_id = cursor.lastrowid
+        
+        for ligne in panier:
+            cursor.execute("INSERT INTO Details_Vente (vente_id, produit_id, quantite, prix_unitaire) VALUES (?, ?, ?, ?)",
+                           (vente_id, ligne.produit_id, ligne.quantite, ligne.prix_unitaire))
+            # Décrément relatif : une vente concurrente sur une autre caisse n'est pas écrasée.
+            cursor.execute("UPDATE Produits SET quantite_stock = quantite_stock - ? WHERE id = ? AND quantite_stock >= ?",
+                           (ligne.quantite, ligne.produit_id, ligne.quantite))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return None
+        conn.commit()
+        return vente_id
+
+# Les rapports lisent la base principale et les agrégats des années archivées,
+# sans jamais ouvrir les fichiers d'archive.
+def get_total_revenue(start_date=None, end_date=None, conn=None):
+    filtre_ventes, params_ventes = _filtre_jours("DATE(date_vente)", start_date, end_date)
+    filtre_agregats, params_agregats = _filtre_jours("jour", start_date, end_date)
+    query = f"""
+        SELECT (SELECT TOTAL(total) FROM Ventes{filtre_ventes})
+             + (SELECT TOTAL(total) FROM Agregats_Ventes_Jour{filtre_agregats}) as total
+    """
+    with _connexion(conn) as conn:
+        total = conn.execute(query, params_ventes + params_agregats).fetchone()['total']
+    return total if total else 0
+
+def get_total_profit(start_date=None, end_date=None, conn=None):
+    filtre_ventes, params_ventes = _filtre_jours("DATE(V.date_vente)", start_date, end_date)
+    filtre_agregats, params_agregats = _filtre_jours("A.jour", start_date, end_date)
+    query = f"""
+        SELECT TOTAL(profit) as profit FROM (
+            SELECT DV.quantite * (DV.prix_unitaire - P.prix_achat) as profit
+            FROM Details_Vente DV
+            JOIN Produits P ON DV.produit_id = P.id
+            JOIN Ventes V ON DV.vente_id = V.id{filtre_ventes}
+            UNION ALL
+            SELECT A.chiffre_affaires - A.quantite * P.prix_achat
+            FROM Agregats_Ventes A
+            JOIN Produits P ON A.produit_id = P.id{filtre_agregats}
+        )
+    """
+    with _connexion(conn) as conn:
+        profit = conn.execute(query, params_ventes + params_agregats).fetchone()['profit']
+    return profit if profit else 0
+
+def get_best_selling_products(start_date=None, end_date=None, limit=5, conn=None):
+    filtre_ventes, params_ventes = _filtre_jours("DATE(V.date_vente)", start_date, end_date)
+    filtre_agregats, params_agregats = _filtre_jours("jour", start_date, end_date)
+    query = f"""
+        SELECT P.nom, SUM(L.quantite) as total_vendu
+        FROM (
+            SELECT DV.produit_id, DV.quantite
+            FROM Details_Vente DV
+            JOIN Ventes V ON DV.vente_id = V.id{filtre_ventes}
+            UNION ALL
+            SELECT produit_id, quantite FROM Agregats_Ventes{filtre_agregats}
+        ) L
+        JOIN Produits P ON L.produit_id = P.id
+        GROUP BY P.nom ORDER BY total_vendu DESC LIMIT ?
+    """
+    with _connexion(conn) as conn:
+        return conn.execute(query, params_ventes + params_agregats + [limit]).fetchall()
+
+def get_ventes_par_vendeur(start_date=None, end_date=None, conn=None):
+    """Nombre de ventes et chiffre d'affaires par vendeur ; user_id 0 regroupe les ventes sans vendeur connu."""
+    filtre_ventes, params_ventes = _filtre_jours("DATE(date_vente)", start_date, end_date)
+    filtre_agregats, params_agregats = _filtre_jours("jour", start_date, end_date)
+    query = f"""
+        SELECT L.user_id, U.username, SUM(L.nb_ventes) as nb_ventes, TOTAL(L.total) as total
+        FROM (
+            SELECT COALESCE(user_id, 0) as user_id, COUNT(*) as nb_ventes, TOTAL(total) as total
+            FROM Ventes{filtre_ventes} GROUP BY user_id
+            UNION ALL
+            SELECT user_id, nb_ventes, total FROM Agregats_Ventes_Vendeur{filtre_agregats}
+        ) L
+        LEFT JOIN Utilisateurs U ON L.user_id = U.id
+        GROUP BY L.user_id ORDER BY total DESC
+    """
+    with _connexion(conn) as conn:
+        return conn.execute(query, params_ventes + params_agregats).fetchall()
+
 if __name__ == '__main__':
     initialiser_db()
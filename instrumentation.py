@@ -0,0 +1,106 @@
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from kivy.clock import Clock
+
+# --- Constantes ---
+# Chemin du fichier de trace ; l'instrumentation est désactivée si la variable est absente.
+FICHIER_TRACE = os.environ.get('GESTION_VENTES_TRACE')
+TAILLE_TRACE = 20000        # nombre d'évènements conservés (trace glissante)
+DUREE_IMAGE = 1 / 60.0      # durée d'une image à 60 ips
+SEUIL_IMAGE_LENTE = 1.5     # une image est perdue au-delà de 1,5 x DUREE_IMAGE
+
+_PHASE_INACTIVE = nullcontext()
+
+class Traceur:
+    """
+    Mesure les phases de rafraîchissement de chaque écran (requête, construction, layout)
+    et les images perdues. La trace est au format Trace Event (chrome://tracing, Perfetto).
+    """
+    def __init__(self, fichier=FICHIER_TRACE, taille=TAILLE_TRACE, ecran_courant=None):
+        self.fichier = fichier
+        self.actif = bool(fichier)
+        self.evenements = deque(maxlen=taille)
+        self.images_perdues = 0
+        self.ecran_courant = ecran_courant or (lambda: '')
+        self._origine = time.perf_counter()
+        self._surveillance = None
+        self._fils = {}  # écran -> tid ; chaque écran a sa propre ligne dans le visualiseur
+
+    def _us(self, instant):
+        return (instant - self._origine) * 1e6
+
+    def _tid(self, ecran):
+        tid = self._fils.get(ecran)
+        if tid is None:
+            tid = self._fils[ecran] = len(self._fils) + 1
+        return tid
+
+    def _ajouter_phase(self, ecran, nom, debut, fin):
+        self.evenements.append({
+            'name': nom, 'cat': ecran, 'ph': 'X', 'pid': 1, 'tid': self._tid(ecran),
+            'ts': self._us(debut), 'dur': (fin - debut) * 1e6,
+        })
+
+    # --- Phases ---
+    def phase(self, ecran, nom):
+        """Contexte qui chronomètre une phase ; ne coûte rien quand le traceur est inactif."""
+        if not self.actif:
+            return _PHASE_INACTIVE
+        return self._phase(ecran, nom)
+
+    @contextmanager
+    def _phase(self, ecran, nom):
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._ajouter_phase(ecran, nom, debut, time.perf_counter())
+
+    def mesurer_layout(self, ecran):
+        """Chronomètre jusqu'à l'image suivante, où Kivy fait le layout et dessine les widgets."""
+        if not self.actif:
+            return
+        debut = time.perf_counter()
+        Clock.schedule_once(lambda dt: self._ajouter_phase(ecran, 'layout', debut, time.perf_counter()), 0)
+
+    # --- Images perdues ---
+    def demarrer(self):
+        if self.actif and self._surveillance is None:
+            self._surveillance = Clock.schedule_interval(self._surveiller_image, 0)
+
+    def arreter(self):
+        if self._surveillance is not None:
+            self._surveillance.cancel()
+            self._surveillance = None
+
+    def _surveiller_image(self, dt):
+        if dt <= DUREE_IMAGE * SEUIL_IMAGE_LENTE:
+            return
+        perdues = int(dt / DUREE_IMAGE) - 1
+        self.images_perdues += perdues
+        maintenant = time.perf_counter()
+        ecran = self.ecran_courant()
+        self.evenements.append({
+            'name': 'images_perdues', 'cat': 'images', 'ph': 'X', 'pid': 1, 'tid': self._tid('images'),
+            'ts': self._us(maintenant - dt), 'dur': dt * 1e6, 'args': {'ecran': ecran, 'perdues': perdues},
+        })
+        self.evenements.append({
+            'name': 'images_perdues', 'ph': 'C', 'pid': 1, 'ts': self._us(maintenant),
+            'args': {'total': self.images_perdues},
+        })
+
+    # --- Export ---
+    def enregistrer(self, chemin=None):
+        """Écrit la trace glissante dans un fichier JSON et retourne son chemin."""
+        chemin = chemin or self.fichier
+        if not chemin:
+            return None
+        noms_fils = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': ecran}}
+                     for ecran, tid in self._fils.items()]
+        with open(chemin, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': noms_fils + list(self.evenements), 'displayTimeUnit': 'ms'}, f)
+        return chemin
@@ -1,160 +1,69 @@
+import time
+DEBUT_DEMARRAGE = time.perf_counter()  # avant les imports Kivy, qui pèsent lourd au démarrage à froid
+
+import cProfile
+import os
 import sqlite3
-import random
-import string
-from functools import partial
+import threading
+from functools import partial, wraps
+from kivy.clock import Clock
 from kivy.lang import Builder
+from kivy.logger import Logger
 from kivy.core.window import Window
 from kivymd.app import MDApp
 from kivymd.uix.list import TwoLineListItem, OneLineListItem
 from kivymd.uix.boxlayout import MDBoxLayout
+from kivymd.uix.floatlayout import MDFloatLayout
 from kivymd.uix.button import MDFlatButton, MDIconButton
 from kivymd.uix.dialog import MDDialog
 from kivymd.uix.textfield import MDTextField
 from kivymd.uix.label import MDLabel
 from kivymd.toast import toast
-from datetime import datetime, date, timedelta
+from datetime import date, timedelta
 from kivy.utils import get_color_from_hex
 from kivymd.uix.pickers import MDDatePicker
 
+import analytics
 import database
-from database import find_or_create_client, incrementer_points_bonus, get_client_contact
+from instrumentation import Traceur
+from maintenance import PlanificateurMaintenance
+from panier import Panier
+from database import (
+    find_or_create_client, get_client_contact,
+    lister_produits, lister_produits_en_stock, trouver_produit_par_code, ajouter_produit, modifier_produit,
+    supprimer_produit, lister_clients, lister_ventes, enregistrer_vente,
+    get_total_revenue, get_total_profit, get_best_selling_products, get_ventes_par_vendeur,
+)
 
 # --- Constantes ---
 STOCK_FAIBLE_SEUIL = 10
+HORIZON_PREVISION_JOURS = 7
+# Chemin du fichier de profil cProfile du démarrage (désactivé si la variable est absente)
+PROFIL_DEMARRAGE = os.environ.get('GESTION_VENTES_PROFIL_DEMARRAGE')
 
-# --- Fonctions DB ---
-def get_db_connection():
-    conn = sqlite3.connect('gestion_ventes.db', detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def lister_produits(search_term=""):
-    conn = get_db_connection()
-    query = "SELECT * FROM Produits WHERE nom LIKE ? ORDER BY nom"
-    produits = conn.execute(query, ('%' + search_term + '%',)).fetchall()
-    conn.close()
-    return produits
-
-def lister_produits_en_stock(search_term=""):
-    conn = get_db_connection()
-    query = "SELECT * FROM Produits WHERE quantite_stock > 0 AND nom LIKE ? ORDER BY nom"
-    produits = conn.execute(query, ('%' + search_term + '%',)).fetchall()
-    conn.close()
-    return produits
-
-def ajouter_produit(nom, desc, prix_achat, prix_vente, stock):
-    conn = get_db_connection()
-    conn.execute("INSERT INTO Produits (id, nom, description, prix_achat, prix_vente, quantite_stock) VALUES (?, ?, ?, ?, ?, ?)",
-                 ('PROD-' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=4)), nom.capitalize(), desc, prix_achat, prix_vente, stock))
-    conn.commit()
-    conn.close()
-
-def modifier_produit(produit_id, nom, desc, prix_achat, prix_vente, stock):
-    conn = get_db_connection()
-    conn.execute("UPDATE Produits SET nom = ?, description = ?, prix_achat = ?, prix_vente = ?, quantite_stock = ? WHERE id = ?",
-                 (nom.capitalize(), desc, prix_achat, prix_vente, stock, produit_id))
-    conn.commit()
-    conn.close()
-
-def supprimer_produit(produit_id):
-    conn = get_db_connection()
-    conn.execute("DELETE FROM Produits WHERE id = ?", (produit_id,))
-    conn.commit()
-    conn.close()
-
-def lister_clients():
-    conn = get_db_connection()
-    clients = conn.execute("SELECT * FROM Clients ORDER BY nom").fetchall()
-    conn.close()
-    return clients
-
-def lister_ventes(filter_date=None):
-    conn = get_db_connection()
-    query = """
-        SELECT V.id, V.date_vente, V.total, C.nom as client_nom
-        FROM Ventes V
-        LEFT JOIN Clients C ON V.client_id = C.id
-    """
-    params = []
-    if filter_date:
-        query += " WHERE DATE(V.date_vente) = ?"
-        params.append(filter_date.strftime("%Y-%m-%d"))
-    
-    query += " ORDER BY V.date_vente DESC"
-    
-    ventes = conn.execute(query, params).fetchall()
-    conn.close()
-    return ventes
-
-def enregistrer_vente(client_id, panier):
-    conn = get_db_connection()
-    try:
-        total_vente = sum(item['produit']['prix_vente'] * item['quantite'] for item in panier)
-        heure_de_vente = datetime.now()
-        
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO Ventes (date_vente, total, client_id) VALUES (?, ?, ?)", (heure_de_vente, total_vente, client_id))
-        vente_id = cursor.lastrowid
-        
-        for item in panier:
-            produit = item['produit']
-            quantite_vendue = item['quantite']
-            cursor.execute("INSERT INTO Details_Vente (vente_id, produit_id, quantite, prix_unitaire) VALUES (?, ?, ?, ?)",
-                           (vente_id, produit['id'], quantite_vendue, produit['prix_vente']))
-            nouveau_stock = produit['quantite_stock'] - quantite_vendue
-            cursor.execute("UPDATE Produits SET quantite_stock = ? WHERE id = ?", (nouveau_stock, produit['id']))
-        conn.commit()
-    finally:
-        conn.close()
-
-def get_total_revenue(start_date=None, end_date=None):
-    conn = get_db_connection()
-    query = "SELECT SUM(total) as total FROM Ventes"
-    params = []
-    if start_date and end_date:
-        query += " WHERE DATE(date_vente) BETWEEN ? AND ?"
-        params.extend([start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")])
-    
-    total = conn.execute(query, params).fetchone()['total']
-    conn.close()
-    return total if total else 0
-
-def get_total_profit(start_date=None, end_date=None):
-    conn = get_db_connection()
-    query = """
-        SELECT SUM(DV.quantite * (DV.prix_unitaire - P.prix_achat)) as profit
-        FROM Details_Vente DV
-        JOIN Produits P ON DV.produit_id = P.id
-        JOIN Ventes V ON DV.vente_id = V.id
+_profileur_demarrage = cProfile.Profile() if PROFIL_DEMARRAGE else None
+if _profileur_demarrage:
+    _profileur_demarrage.enable()
+
+# --- Actions de caisse ---
+def action_protegee(methode):
     """
-    params = []
-    if start_date and end_date:
-        query += " WHERE DATE(V.date_vente) BETWEEN ? AND ?"
-        params.extend([start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")])
-        
-    profit = conn.execute(query, params).fetchone()['profit']
-    conn.close()
-    return profit if profit else 0
-
-def get_best_selling_products(start_date=None, end_date=None, limit=5):
-    conn = get_db_connection()
-    query = """
-        SELECT P.nom, SUM(DV.quantite) as total_vendu
-        FROM Details_Vente DV
-        JOIN Produits P ON DV.produit_id = P.id
-        JOIN Ventes V ON DV.vente_id = V.id
+    Action qui lit ou écrit la base : repousse l'entretien de fond et affiche un message
+    au lieu de planter si l'action est refusée ou si une autre caisse garde la base verrouillée.
     """
-    params = []
-    if start_date and end_date:
-        query += " WHERE DATE(V.date_vente) BETWEEN ? AND ?"
-        params.extend([start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")])
-        
-    query += " GROUP BY P.nom ORDER BY total_vendu DESC LIMIT ?"
-    params.append(limit)
-    
-    produits = conn.execute(query, params).fetchall()
-    conn.close()
-    return produits
+    @wraps(methode)
+    def wrapper(self, *args, **kwargs):
+        self.maintenance.signaler_activite()
+        try:
+            return methode(self, *args, **kwargs)
+        except database.PermissionRefusee as e:
+            toast(str(e))
+            if self.dialog: self.dialog.dismiss()
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            toast("Base occupée par une autre caisse, veuillez réessayer.")
+    return wrapper
 
 # --- Classes de dialogue ---
 class BaseDialogContent(MDBoxLayout):
@@ -191,13 +100,14 @@ class BaseDialogContent(MDBoxLayout):
 
 class ProductDialogContent(BaseDialogContent):
     def __init__(self, **kwargs):
-        super().__init__(height="350dp", **kwargs)
+        super().__init__(height="420dp", **kwargs)
         self.nom_field = MDTextField(hint_text="Nom du produit")
         self.desc_field = MDTextField(hint_text="Description")
         self.prix_achat_field = MDTextField(hint_text="Prix d'achat (Fc)", input_filter="float")
         self.prix_vente_field = MDTextField(hint_text="Prix de vente (Fc)", input_filter="float")
         self.stock_field = MDTextField(hint_text="Quantité en stock", input_filter="int")
-        self.fields = [self.nom_field, self.desc_field, self.prix_achat_field, self.prix_vente_field, self.stock_field]
+        self.code_barre_field = MDTextField(hint_text="Code-barres (facultatif)")
+        self.fields = [self.nom_field, self.desc_field, self.prix_achat_field, self.prix_vente_field, self.stock_field, self.code_barre_field]
         for i, field in enumerate(self.fields):
             field.on_text_validate = self.focus_next_field if i < len(self.fields) - 1 else self.ok_action
             self.add_widget(field)
@@ -234,18 +144,48 @@ class FinalizeSaleDialogContent(BaseDialogContent):
             field.on_text_validate = self.focus_next_field if i < len(self.fields) - 1 else self.ok_action
             self.add_widget(field)
 
+class CartLineDialogContent(BaseDialogContent):
+    def __init__(self, **kwargs):
+        super().__init__(height="240dp", **kwargs)
+        self.quantite_field = MDTextField(hint_text="Quantité", input_filter="int")
+        self.prix_field = MDTextField(hint_text="Prix unitaire (Fc)", input_filter="float")
+        self.remise_field = MDTextField(hint_text="Remise (%)", input_filter="float")
+        self.fields = [self.quantite_field, self.prix_field, self.remise_field]
+        for i, field in enumerate(self.fields):
+            field.on_text_validate = self.focus_next_field if i < len(self.fields) - 1 else self.ok_action
+            self.add_widget(field)
+
+# --- Onglets construits à la demande ---
+class ReportsView(MDBoxLayout):
+    pass
+
+class UsersView(MDFloatLayout):
+    pass
+
+# nom de l'onglet -> (id de l'onglet, fichier kv, classe du contenu)
+LAZY_TABS = {
+    'reports_screen': ('reports_tab', 'rapports.kv', ReportsView),
+    'users_screen': ('users_tab', 'utilisateurs.kv', UsersView),
+}
+
 # --- Application Principale ---
 class MainApp(MDApp):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.dialog = None
         self.taux_usd_vers_fc = 2800.0
-        self.panier = []
+        self.panier = Panier(on_change=self.on_cart_change)
+        self.cart_widgets = {}  # produit_id -> (ligne du panier, libellé)
         self.selected_item = None
+        self.scan_mode = False
         self.sales_filter_date = None
         self.reports_start_date = None
         self.reports_end_date = None
         self.current_user = None
+        self.lazy_views = {}
+        self.stale_tabs = set()
+        self.traceur = Traceur(ecran_courant=self.current_screen_name)
+        self.maintenance = PlanificateurMaintenance()
 
     def build(self):
         self.theme_cls.primary_palette = "Indigo"
@@ -256,8 +196,57 @@ class MainApp(MDApp):
     def on_start(self):
         self.root.current = 'login_screen'
         Window.bind(on_key_down=self._on_keyboard_down)
+        Clock.schedule_once(self._end_startup_profile, 0)
+        self.traceur.demarrer()
+        self.maintenance.start()
+        # L'historique des ventes est chargé pour les analyses sans bloquer l'interface.
+        threading.Thread(target=analytics.prechauffer, name='analytics', daemon=True).start()
+
+    def on_stop(self):
+        self.maintenance.arreter()
+        self.traceur.arreter()
+        self.traceur.enregistrer()
+
+    def current_screen_name(self):
+        if self.root.current == 'main_screen':
+            return self.root.ids.bottom_nav.current
+        return self.root.current
+
+    def dump_trace(self):
+        chemin = self.traceur.enregistrer()
+        if chemin:
+            toast(f"Trace enregistrée dans {chemin}")
+
+    def _end_startup_profile(self, *args):
+        """Appelé à la première image : mesure le démarrage à froid."""
+        Logger.info(f"Demarrage: premiere image en {(time.perf_counter() - DEBUT_DEMARRAGE) * 1000:.0f} ms")
+        if _profileur_demarrage:
+            _profileur_demarrage.disable()
+            _profileur_demarrage.dump_stats(PROFIL_DEMARRAGE)
+            Logger.info(f"Demarrage: profil enregistre dans {PROFIL_DEMARRAGE}")
+
+    @property
+    def reports_view(self):
+        return self.get_lazy_view('reports_screen')
+
+    @property
+    def users_view(self):
+        return self.get_lazy_view('users_screen')
+
+    def get_lazy_view(self, tab_name):
+        """Construit le contenu d'un onglet lourd (kv + widgets) à sa première utilisation."""
+        view = self.lazy_views.get(tab_name)
+        if view is None:
+            tab_id, kv_file, view_class = LAZY_TABS[tab_name]
+            Builder.load_file(kv_file)
+            view = self.lazy_views[tab_name] = view_class()
+            self.root.ids[tab_id].add_widget(view)
+        return view
 
     def _on_keyboard_down(self, instance, keyboard, keycode, text, modifiers):
+        if keycode == 293 and self.traceur.actif:  # F12
+            self.dump_trace()
+            return True
         if self.root.current == 'login_screen' and keycode == 43:  # Tab
             if self.root.ids.username_field.focus:
                 self.root.ids.password_field.focus = True
@@ -270,8 +259,10 @@ class MainApp(MDApp):
         password = self.root.ids.password_field.text
         user = database.verifier_utilisateur(username, password)
         if user:
-            self.current_user = user
+            self.current_user = database.ouvrir_session(user)
             self.root.current = 'main_screen'
+            # L'onglet laissé ouvert par l'utilisateur précédent peut être interdit à celui-ci.
+            self.root.ids.bottom_nav.switch_tab('products_screen')
             self.setup_ui_for_role()
             self.sales_filter_date = date.today()
             if 'sales_date_filter_field' in self.root.ids:
@@ -281,18 +272,19 @@ class MainApp(MDApp):
             toast("Nom d'utilisateur ou mot de passe incorrect.")
 
     def logout(self):
+        database.fermer_session()
         self.current_user = None
         self.root.current = 'login_screen'
         self.root.ids.username_field.text = ""
         self.root.ids.password_field.text = ""
 
     def setup_ui_for_role(self):
-        is_admin = self.current_user['role'] == 'admin'
+        peut = self.current_user.peut
         
-        self.root.ids.add_product_button.disabled = not is_admin
-        self.root.ids.add_client_button.disabled = not is_admin
-        self.root.ids.reports_tab.disabled = not is_admin
-        self.root.ids.users_tab.disabled = not is_admin
+        self.root.ids.add_product_button.disabled = not peut('gerer_produits')
+        self.root.ids.add_client_button.disabled = not peut('gerer_clients')
+        self.root.ids.reports_tab.disabled = not peut('consulter_rapports')
+        self.root.ids.users_tab.disabled = not peut('gerer_utilisateurs')
         
         self.root.ids.product_toolbar.right_action_items = [
             ["currency-usd", lambda x: self.show_rate_dialog()],
@@ -301,74 +293,142 @@ class MainApp(MDApp):
 
     def on_tab_switch(self, *args):
         active_tab_name = self.root.ids.bottom_nav.current
-        if active_tab_name == 'reports_screen':
-            self.set_reports_filter_period('all')
-        elif active_tab_name == 'sales_screen':
+        # Les listes produits et clients ne sont rechargées que si elles sont périmées.
+        if active_tab_name in ('reports_screen', 'sales_screen', 'users_screen') or active_tab_name in self.stale_tabs:
+            self.refresh_tab(active_tab_name)
+
+    def refresh_tab(self, tab_name):
+        self.stale_tabs.discard(tab_name)
+        if tab_name == 'products_screen':
+            self.update_product_list()
+        elif tab_name == 'clients_screen':
+            self.update_client_list()
+        elif tab_name == 'sales_screen':
             if not self.sales_filter_date:
                 self.sales_filter_date = date.today()
                 self.root.ids.sales_date_filter_field.text = self.sales_filter_date.strftime("%d/%m/%Y")
             self.update_sales_list()
-        elif active_tab_name == 'users_screen':
+        elif tab_name == 'reports_screen':
+            self.set_reports_filter_period('all')
+        elif tab_name == 'users_screen':
             self.update_user_list()
 
     def update_all_lists(self):
-        self.update_product_list()
-        self.update_client_list()
-        self.update_sales_list()
-        if self.current_user and self.current_user['role'] == 'admin':
-            self.update_user_list()
+        """Rafraîchit l'onglet visible ; les autres le seront à leur prochaine visite."""
+        self.stale_tabs = {'products_screen', 'clients_screen', 'sales_screen', 'reports_screen', 'users_screen'}
+        self.refresh_tab(self.root.ids.bottom_nav.current)
 
+    @action_protegee
     def update_reports(self):
-        total_revenue = get_total_revenue(self.reports_start_date, self.reports_end_date)
-        total_profit = get_total_profit(self.reports_start_date, self.reports_end_date)
-        self.root.ids.total_revenue_label.text = f"Chiffre d'affaires : {total_revenue:,.2f} Fc | Bénéfice : {total_profit:,.2f} Fc"
-        
-        best_selling_list = self.root.ids.best_selling_list
-        best_selling_list.clear_widgets()
-        for product in get_best_selling_products(self.reports_start_date, self.reports_end_date):
-            item = TwoLineListItem(text=f"{product['nom']}", secondary_text=f"Vendu : {product['total_vendu']} unités")
-            best_selling_list.add_widget(item)
+        database.verifier_permission('consulter_rapports')
+        with self.traceur.phase('reports_screen', 'requete'):
+            total_revenue = get_total_revenue(self.reports_start_date, self.reports_end_date)
+            total_profit = get_total_profit(self.reports_start_date, self.reports_end_date)
+            best_selling = get_best_selling_products(self.reports_start_date, self.reports_end_date)
+            par_vendeur = get_ventes_par_vendeur(self.reports_start_date, self.reports_end_date)
+        with self.traceur.phase('reports_screen', 'construction'):
+            self.reports_view.ids.total_revenue_label.text = f"Chiffre d'affaires : {total_revenue:,.2f} Fc | Bénéfice : {total_profit:,.2f} Fc"
+
+            best_selling_list = self.reports_view.ids.best_selling_list
+            best_selling_list.clear_widgets()
+            for product in best_selling:
+                item = TwoLineListItem(text=f"{product['nom']}", secondary_text=f"Vendu : {product['total_vendu']} unités")
+                best_selling_list.add_widget(item)
+
+            sellers_list = self.reports_view.ids.sellers_list
+            sellers_list.clear_widgets()
+            for vendeur in par_vendeur:
+                item = TwoLineListItem(text=vendeur['username'] or "Vendeur inconnu",
+                                       secondary_text=f"{vendeur['nb_ventes']} ventes | {vendeur['total']:,.2f} Fc")
+                sellers_list.add_widget(item)
         
+        self.update_analytics_report()
         self.update_inventory_report()
+        self.traceur.mesurer_layout('reports_screen')
+
+    def update_analytics_report(self):
+        """Calcule les analyses dans un thread ; l'affichage est fait sur le thread Kivy."""
+        periode = (self.reports_start_date, self.reports_end_date)
+        self.reports_view.ids.trend_label.text = "Analyse en cours..."
+        def calculer():
+            try:
+                with self.traceur.phase('reports_screen', 'analyse'):
+                    resultat = analytics.analyser(*periode, horizon=HORIZON_PREVISION_JOURS)
+            except Exception:  # ex. base verrouillée : le libellé ne doit pas rester sur "en cours"
+                Logger.exception("Analytics: échec du calcul")
+                Clock.schedule_once(lambda dt: self.show_analytics_error(periode))
+                return
+            Clock.schedule_once(lambda dt: self.show_analytics_report(periode, resultat))
+        threading.Thread(target=calculer, name='analyse', daemon=True).start()
+
+    def show_analytics_error(self, periode):
+        if periode == (self.reports_start_date, self.reports_end_date):
+            self.reports_view.ids.trend_label.text = "Analyse indisponible, réessayez plus tard."
+
+    def show_analytics_report(self, periode, resultat):
+        if periode != (self.reports_start_date, self.reports_end_date):
+            return  # la période a changé pendant le calcul : un autre calcul est en cours
+        moyenne = resultat['moyenne_mobile_ca'][-1] if len(resultat['moyenne_mobile_ca']) else 0
+        self.reports_view.ids.trend_label.text = f"Moyenne mobile (7 jours) : {moyenne:,.2f} Fc / jour"
+
+        with self.traceur.phase('reports_screen', 'construction'):
+            analytics_list = self.reports_view.ids.analytics_list
+            analytics_list.clear_widgets()
+            marges = resultat['marges']
+            ordre = sorted(range(len(resultat['noms'])), key=lambda i: (resultat['classes_abc'][i], -marges['chiffre_affaires'][i]))
+            for i in ordre:
+                item = TwoLineListItem(
+                    text=f"[{resultat['classes_abc'][i]}] {resultat['noms'][i]}",
+                    secondary_text=f"Marge : {marges['marge'][i]:,.2f} Fc ({marges['taux_marge'][i]:.0%}) | Prévision {HORIZON_PREVISION_JOURS} j : {resultat['prevision'][i]:.0f} unités"
+                )
+                analytics_list.add_widget(item)
 
     def update_inventory_report(self):
-        inventory_list = self.root.ids.inventory_report_list
-        inventory_list.clear_widgets()
-        for p in lister_produits():
-            stock_value = p['prix_achat'] * p['quantite_stock']
-            stock_color_hex = "#FF0000" if p['quantite_stock'] <= STOCK_FAIBLE_SEUIL else "#000000"
-            item = TwoLineListItem(
-                text=f"{p['nom']}",
-                secondary_text=f"[color={stock_color_hex}]Stock: {p['quantite_stock']}[/color] | Valeur: {stock_value:,.2f} Fc"
-            )
-            inventory_list.add_widget(item)
+        with self.traceur.phase('reports_screen', 'requete'):
+            produits = lister_produits()
+        with self.traceur.phase('reports_screen', 'construction'):
+            inventory_list = self.reports_view.ids.inventory_report_list
+            inventory_list.clear_widgets()
+            for p in produits:
+                stock_value = p['prix_achat'] * p['quantite_stock']
+                stock_color_hex = "#FF0000" if p['quantite_stock'] <= STOCK_FAIBLE_SEUIL else "#000000"
+                item = TwoLineListItem(
+                    text=f"{p['nom']}",
+                    secondary_text=f"[color={stock_color_hex}]Stock: {p['quantite_stock']}[/color] | Valeur: {stock_value:,.2f} Fc"
+                )
+                inventory_list.add_widget(item)
 
+    @action_protegee
     def update_user_list(self):
-        user_list = self.root.ids.user_list
-        user_list.clear_widgets()
-        for user in database.lister_utilisateurs():
-            item = OneLineListItem(text=f"{user['username']} ({user['role']})")
-            user_list.add_widget(item)
+        with self.traceur.phase('users_screen', 'requete'):
+            users = database.lister_utilisateurs()
+        with self.traceur.phase('users_screen', 'construction'):
+            user_list = self.users_view.ids.user_list
+            user_list.clear_widgets()
+            for user in users:
+                item = OneLineListItem(text=f"{user['username']} ({user['role']})")
+                user_list.add_widget(item)
+        self.traceur.mesurer_layout('users_screen')
 
     def set_reports_filter_period(self, period):
         today = date.today()
         if period == 'day':
             self.reports_start_date = today
             self.reports_end_date = today
-            self.root.ids.reports_date_filter_field.text = today.strftime("%d/%m/%Y")
+            self.reports_view.ids.reports_date_filter_field.text = today.strftime("%d/%m/%Y")
         elif period == 'week':
             self.reports_start_date = today - timedelta(days=today.weekday())
             self.reports_end_date = self.reports_start_date + timedelta(days=6)
-            self.root.ids.reports_date_filter_field.text = f"{self.reports_start_date.strftime('%d/%m')} - {self.reports_end_date.strftime('%d/%m')}"
+            self.reports_view.ids.reports_date_filter_field.text = f"{self.reports_start_date.strftime('%d/%m')} - {self.reports_end_date.strftime('%d/%m')}"
         elif period == 'month':
             self.reports_start_date = today.replace(day=1)
             next_month = self.reports_start_date.replace(day=28) + timedelta(days=4)
             self.reports_end_date = next_month - timedelta(days=next_month.day)
-            self.root.ids.reports_date_filter_field.text = today.strftime("%B %Y")
+            self.reports_view.ids.reports_date_filter_field.text = today.strftime("%B %Y")
         else: # 'all'
             self.reports_start_date = None
             self.reports_end_date = None
-            self.root.ids.reports_date_filter_field.text = "Toute la période"
+            self.reports_view.ids.reports_date_filter_field.text = "Toute la période"
         self.update_reports()
 
     def show_reports_date_picker(self):
@@ -380,7 +440,7 @@ class MainApp(MDApp):
         if date_range:
             self.reports_start_date = date_range[0]
             self.reports_end_date = date_range[-1]
-            self.root.ids.reports_date_filter_field.text = f"{self.reports_start_date.strftime('%d/%m/%Y')} - {self.reports_end_date.strftime('%d/%m/%Y')}"
+            self.reports_view.ids.reports_date_filter_field.text = f"{self.reports_start_date.strftime('%d/%m/%Y')} - {self.reports_end_date.strftime('%d/%m/%Y')}"
             self.update_reports()
 
     def clear_reports_date_filter(self):
@@ -399,26 +459,56 @@ class MainApp(MDApp):
     def search_products(self):
         self.update_product_list(self.root.ids.search_field.text)
 
+    def toggle_scan_mode(self):
+        self.scan_mode = not self.scan_mode
+        field = self.root.ids.sale_search_field
+        field.hint_text = "Scanner un code-barres..." if self.scan_mode else "Rechercher un produit..."
+        self.root.ids.scan_mode_button.icon = "barcode-off" if self.scan_mode else "barcode-scan"
+        self.root.ids.search_results_list.clear_widgets()
+        field.text = ""
+        field.focus = True
+
     def search_products_for_sale(self):
         search_term = self.root.ids.sale_search_field.text
         results_list = self.root.ids.search_results_list
         results_list.clear_widgets()
-        if search_term:
-            for p in lister_produits_en_stock(search_term):
-                item = TwoLineListItem(
-                    text=f"{p['nom']}",
-                    secondary_text=f"Stock: {p['quantite_stock']} | Prix: {p['prix_vente']:,.2f} Fc",
-                    on_release=lambda x, produit=p: self.ask_quantity_for_product(produit)
-                )
-                item.product_data = p
-                results_list.add_widget(item)
+        # En mode scan, pas de recherche LIKE à chaque caractère tapé par le lecteur.
+        if search_term and not self.scan_mode:
+            with self.traceur.phase('new_sale_screen', 'requete'):
+                produits = lister_produits_en_stock(search_term)
+            with self.traceur.phase('new_sale_screen', 'construction'):
+                for p in produits:
+                    item = TwoLineListItem(
+                        text=f"{p['nom']}",
+                        secondary_text=f"Stock: {p['quantite_stock']} | Prix: {p['prix_vente']:,.2f} Fc",
+                        on_release=lambda x, produit=p: self.ask_quantity_for_product(produit)
+                    )
+                    item.product_data = p
+                    results_list.add_widget(item)
+            self.traceur.mesurer_layout('new_sale_screen')
 
     def handle_sale_search_enter(self):
-        if not self.root.ids.sale_search_field.text and self.panier:
+        code = self.root.ids.sale_search_field.text.strip()
+        if not code and self.panier:
             self.validate_sale()
+        elif code and self.add_scanned_product(code):
+            pass
+        elif self.scan_mode:
+            toast(f"Code inconnu : {code}")
+            self.root.ids.sale_search_field.text = ""
         else:
             self.select_first_product_from_search()
 
+    def add_scanned_product(self, code):
+        """Ajoute directement 1 unité du produit correspondant au code, sans demander la quantité."""
+        produit = trouver_produit_par_code(code)
+        if produit is None: return False
+        if not self.panier.ajouter(produit, 1):
+            toast(f"Stock insuffisant pour {produit['nom']}.")
+        self.root.ids.sale_search_field.text = ""
+        self.root.ids.sale_search_field.focus = True
+        return True
+
     def select_first_product_from_search(self):
         results_list = self.root.ids.search_results_list
         if not results_list.children: return
@@ -443,36 +533,88 @@ class MainApp(MDApp):
         if not quantity_text: return
         try:
             quantity = int(quantity_text)
-            if quantity <= 0 or quantity > produit['quantite_stock']: return
         except ValueError: return
-        self.panier.append({'produit': produit, 'quantite': quantity})
-        self.update_cart_list()
+        if quantity <= 0: return
+        if not self.panier.ajouter(produit, quantity):
+            toast(f"Stock insuffisant pour {produit['nom']}.")
+            return
         self.root.ids.sale_search_field.text = ""
         self.root.ids.sale_search_field.focus = True
         self.search_products_for_sale()
 
-    def update_cart_list(self):
-        cart_list = self.root.ids.cart_list
-        cart_list.clear_widgets()
-        total = sum(item['produit']['prix_vente'] * item['quantite'] for item in self.panier)
-        for item in self.panier:
-            p, q = item['produit'], item['quantite']
-            subtotal = p['prix_vente'] * q
-            line_item = MDBoxLayout(adaptive_height=True, spacing="10dp")
-            label = OneLineListItem(text=f"{q} x {p['nom']} - {subtotal:,.2f} Fc")
-            delete_button = MDIconButton(icon="trash-can", on_release=partial(self.remove_from_cart, item))
-            line_item.add_widget(label)
-            line_item.add_widget(delete_button)
-            cart_list.add_widget(line_item)
-        self.root.ids.total_label.text = f"Total: {total:,.2f} Fc"
-
-    def remove_from_cart(self, item, *args):
-        self.panier.remove(item)
-        self.update_cart_list()
+    @staticmethod
+    def cart_line_text(ligne):
+        text = f"{ligne.quantite} x {ligne.nom} - {ligne.sous_total:,.2f} Fc"
+        if ligne.prix_force is not None or ligne.remise:
+            text += f" ({ligne.prix_unitaire:,.2f} Fc/u)"
+        return text
+
+    def on_cart_change(self, action, ligne):
+        """Met à jour uniquement la ligne du panier qui a changé, puis le total."""
+        self.maintenance.signaler_activite()
+        with self.traceur.phase('new_sale_screen', 'panier'):
+            cart_list = self.root.ids.cart_list
+            if action == 'ajout':
+                line_item = MDBoxLayout(adaptive_height=True, spacing="10dp")
+                label = OneLineListItem(text=self.cart_line_text(ligne), on_release=partial(self.show_cart_line_dialog, ligne.produit_id))
+                delete_button = MDIconButton(icon="trash-can", on_release=partial(self.remove_from_cart, ligne.produit_id))
+                line_item.add_widget(label)
+                line_item.add_widget(delete_button)
+                cart_list.add_widget(line_item)
+                self.cart_widgets[ligne.produit_id] = (line_item, label)
+            elif action == 'modification':
+                self.cart_widgets[ligne.produit_id][1].text = self.cart_line_text(ligne)
+            elif action == 'suppression':
+                cart_list.remove_widget(self.cart_widgets.pop(ligne.produit_id)[0])
+            else: # 'vidage'
+                cart_list.clear_widgets()
+                self.cart_widgets.clear()
+            self.root.ids.total_label.text = f"Total: {self.panier.total:,.2f} Fc"
+        self.traceur.mesurer_layout('new_sale_screen')
+
+    def remove_from_cart(self, produit_id, *args):
+        self.panier.retirer(produit_id)
+
+    def show_cart_line_dialog(self, produit_id, *args):
+        ligne = self.panier.lignes.get(produit_id)
+        if ligne is None: return
+        def ok_action(*args): self.edit_cart_line_action(produit_id, content_cls)
+        content_cls = CartLineDialogContent(ok_action=ok_action)
+        content_cls.quantite_field.text = str(ligne.quantite)
+        content_cls.prix_field.text = "" if ligne.prix_force is None else str(ligne.prix_force)
+        content_cls.prix_field.hint_text = f"Prix unitaire (catalogue : {ligne.prix_catalogue:,.2f} Fc)"
+        content_cls.remise_field.text = str(ligne.remise) if ligne.remise else ""
+        self.dialog = MDDialog(
+            title=f"Modifier {ligne.nom}", type="custom", content_cls=content_cls,
+            buttons=[MDFlatButton(text="ANNULER", on_release=lambda x: self.dialog.dismiss()), MDFlatButton(text="SAUVEGARDER", on_release=ok_action)],
+        )
+        content_cls.on_open()
+        self.dialog.on_dismiss = content_cls.on_dismiss
+        self.dialog.open()
+
+    def edit_cart_line_action(self, produit_id, content):
+        try:
+            # Champ vidé : quantité inchangée (mettre 0 pour retirer la ligne).
+            quantite = int(content.quantite_field.text) if content.quantite_field.text.strip() else self.panier.lignes[produit_id].quantite
+            prix = float(content.prix_field.text) if content.prix_field.text else None
+            remise = float(content.remise_field.text or 0.0)
+        except ValueError:
+            toast("Veuillez entrer un nombre valide pour la quantité, le prix et la remise.")
+            return
+        if prix is not None and prix < 0 or not 0 <= remise <= 100:
+            toast("Le prix doit être positif et la remise comprise entre 0 et 100 %.")
+            return
+        if not self.panier.modifier_quantite(produit_id, quantite):
+            toast("Stock insuffisant.")
+            return
+        if quantite > 0:
+            self.panier.definir_prix(produit_id, prix)
+            self.panier.definir_remise(produit_id, remise)
+        self.dialog.dismiss()
 
     def validate_sale(self):
         if not self.panier: return
-        total = sum(item['produit']['prix_vente'] * item['quantite'] for item in self.panier)
+        total = self.panier.total
         def ok_action(*args): self.finalize_and_save_sale(content_cls, print_ticket=False)
         content_cls = FinalizeSaleDialogContent(total=total, ok_action=ok_action)
         self.dialog = MDDialog(
@@ -487,52 +629,65 @@ class MainApp(MDApp):
         self.dialog.on_dismiss = content_cls.on_dismiss
         self.dialog.open()
 
+    @action_protegee
     def finalize_and_save_sale(self, content, print_ticket):
-        client_id = find_or_create_client(content.nom_field.text, content.contact_field.text) if content.nom_field.text else None
-        enregistrer_vente(client_id, self.panier)
-        if client_id and content.contact_field.text:
-            database.incrementer_points_bonus(client_id)
+        # Le client et ses points de fidélité ne sont enregistrés qu'avec la vente, dans la même transaction.
+        client = (content.nom_field.text, content.contact_field.text) if content.nom_field.text else None
+        if enregistrer_vente(self.panier, client=client) is None:
+            toast("Stock insuffisant : un produit du panier vient d'être vendu ailleurs.")
+            return
         if print_ticket: toast("Impression du ticket...")
         self.dialog.dismiss()
-        self.panier = []
-        self.update_cart_list()
+        self.panier.vider()
         self.go_to_main_screen()
 
     def update_product_list(self, search_term=""):
-        product_list = self.root.ids.product_list
-        product_list.clear_widgets()
-        for p in lister_produits(search_term):
-            prix_usd = p['prix_vente'] / self.taux_usd_vers_fc
-            stock_color_hex = "#FF0000" if p['quantite_stock'] <= STOCK_FAIBLE_SEUIL else "#000000"
-            item = TwoLineListItem(
-                text=f"{p['nom']}",
-                secondary_text=f"Prix: {p['prix_vente']:,.2f} Fc (${prix_usd:,.2f}) | [color={stock_color_hex}]Stock: {p['quantite_stock']}[/color]",
-                on_release=partial(self.show_product_choice_dialog, p)
-            )
-            product_list.add_widget(item)
+        with self.traceur.phase('products_screen', 'requete'):
+            produits = lister_produits(search_term)
+        with self.traceur.phase('products_screen', 'construction'):
+            product_list = self.root.ids.product_list
+            product_list.clear_widgets()
+            for p in produits:
+                prix_usd = p['prix_vente'] / self.taux_usd_vers_fc
+                stock_color_hex = "#FF0000" if p['quantite_stock'] <= STOCK_FAIBLE_SEUIL else "#000000"
+                item = TwoLineListItem(
+                    text=f"{p['nom']}",
+                    secondary_text=f"Prix: {p['prix_vente']:,.2f} Fc (${prix_usd:,.2f}) | [color={stock_color_hex}]Stock: {p['quantite_stock']}[/color]",
+                    on_release=partial(self.show_product_choice_dialog, p)
+                )
+                product_list.add_widget(item)
+        self.traceur.mesurer_layout('products_screen')
 
     def update_client_list(self):
-        client_list = self.root.ids.client_list
-        client_list.clear_widgets()
-        for c in lister_clients():
-            bonus_points = c['bonus_points']
-            item = TwoLineListItem(
-                text=f"{c['nom']}",
-                secondary_text=f"Contact: {c['contact']} | Points Bonus: {bonus_points}",
-                on_release=partial(self.show_client_choice_dialog, c)
-            )
-            client_list.add_widget(item)
+        with self.traceur.phase('clients_screen', 'requete'):
+            clients = lister_clients()
+        with self.traceur.phase('clients_screen', 'construction'):
+            client_list = self.root.ids.client_list
+            client_list.clear_widgets()
+            for c in clients:
+                bonus_points = c['bonus_points']
+                item = TwoLineListItem(
+                    text=f"{c['nom']}",
+                    secondary_text=f"Contact: {c['contact']} | Points Bonus: {bonus_points}",
+                    on_release=partial(self.show_client_choice_dialog, c)
+                )
+                client_list.add_widget(item)
+        self.traceur.mesurer_layout('clients_screen')
 
     def update_sales_list(self):
-        sales_list = self.root.ids.sales_list
-        sales_list.clear_widgets()
-        for v in lister_ventes(self.sales_filter_date):
-            date_formatee = v['date_vente'].strftime("%d/%m/%Y %H:%M")
-            item = TwoLineListItem(
-                text=f"Vente #{v['id']} - {v['total']:,.2f} Fc",
-                secondary_text=f"{date_formatee} - {v['client_nom'] or ''}"
-            )
-            sales_list.add_widget(item)
+        with self.traceur.phase('sales_screen', 'requete'):
+            ventes = lister_ventes(self.sales_filter_date)
+        with self.traceur.phase('sales_screen', 'construction'):
+            sales_list = self.root.ids.sales_list
+            sales_list.clear_widgets()
+            for v in ventes:
+                date_formatee = v['date_vente'].strftime("%d/%m/%Y %H:%M")
+                item = TwoLineListItem(
+                    text=f"Vente #{v['id']} - {v['total']:,.2f} Fc",
+                    secondary_text=f"{date_formatee} - {v['client_nom'] or ''}"
+                )
+                sales_list.add_widget(item)
+        self.traceur.mesurer_layout('sales_screen')
             
     def show_sales_date_picker(self):
         initial_date = self.sales_filter_date or date.today()
@@ -561,20 +716,23 @@ class MainApp(MDApp):
         self.dialog.on_dismiss = content_cls.on_dismiss
         self.dialog.open()
 
+    @action_protegee
     def add_product_action(self, content):
         if not all([content.nom_field.text, content.prix_vente_field.text, content.stock_field.text]):
             toast("Nom, prix de vente et stock sont requis.")
             return
         try:
             prix_achat = float(content.prix_achat_field.text or 0.0)
-            ajouter_produit(content.nom_field.text, content.desc_field.text, prix_achat, float(content.prix_vente_field.text), int(content.stock_field.text))
+            if not ajouter_produit(content.nom_field.text, content.desc_field.text, prix_achat, float(content.prix_vente_field.text), int(content.stock_field.text), content.code_barre_field.text.strip()):
+                toast("Ce nom de produit ou ce code-barres est déjà utilisé.")
+                return
             self.update_product_list()
             self.dialog.dismiss()
         except ValueError:
             toast("Veuillez entrer un nombre valide pour les prix et le stock.")
 
     def show_product_choice_dialog(self, produit, *args):
-        if self.current_user['role'] != 'admin': return
+        if not self.current_user.peut('gerer_produits'): return
         self.selected_item = produit
         self.dialog = MDDialog(
             title=f"Actions pour {produit['nom']}",
@@ -595,6 +753,7 @@ class MainApp(MDApp):
         content_cls.prix_achat_field.text = str(self.selected_item['prix_achat'])
         content_cls.prix_vente_field.text = str(self.selected_item['prix_vente'])
         content_cls.stock_field.text = str(self.selected_item['quantite_stock'])
+        content_cls.code_barre_field.text = self.selected_item['code_barre'] or ""
         self.dialog = MDDialog(
             title="Modifier un Produit", type="custom", content_cls=content_cls,
             buttons=[MDFlatButton(text="ANNULER", on_release=lambda x: self.dialog.dismiss()), MDFlatButton(text="SAUVEGARDER", on_release=ok_action)],
@@ -603,13 +762,16 @@ class MainApp(MDApp):
         self.dialog.on_dismiss = content_cls.on_dismiss
         self.dialog.open()
 
+    @action_protegee
     def edit_product_action(self, content):
         if not all([content.nom_field.text, content.prix_vente_field.text, content.stock_field.text]):
             toast("Nom, prix de vente et stock sont requis.")
             return
         try:
             prix_achat = float(content.prix_achat_field.text or 0.0)
-            modifier_produit(self.selected_item['id'], content.nom_field.text, content.desc_field.text, prix_achat, float(content.prix_vente_field.text), int(content.stock_field.text))
+            if not modifier_produit(self.selected_item['id'], content.nom_field.text, content.desc_field.text, prix_achat, float(content.prix_vente_field.text), int(content.stock_field.text), content.code_barre_field.text.strip()):
+                toast("Ce nom de produit ou ce code-barres est déjà utilisé.")
+                return
             self.update_product_list()
             self.dialog.dismiss()
         except ValueError:
@@ -623,6 +785,7 @@ class MainApp(MDApp):
         )
         self.dialog.open()
 
+    @action_protegee
     def delete_product_action(self, *args):
         supprimer_produit(self.selected_item['id'])
         self.update_product_list()
@@ -639,6 +802,7 @@ class MainApp(MDApp):
         self.dialog.on_dismiss = content_cls.on_dismiss
         self.dialog.open()
 
+    @action_protegee
     def add_client_action(self, content):
         if not content.nom_field.text:
             toast("Le nom du client est requis.")
@@ -648,7 +812,7 @@ class MainApp(MDApp):
         self.dialog.dismiss()
 
     def show_client_choice_dialog(self, client, *args):
-        if self.current_user['role'] != 'admin': return
+        if not self.current_user.peut('gerer_clients'): return
         self.selected_item = client
         self.dialog = MDDialog(
             title=f"Actions pour {client['nom']}",
@@ -674,6 +838,7 @@ class MainApp(MDApp):
         self.dialog.on_dismiss = content_cls.on_dismiss
         self.dialog.open()
 
+    @action_protegee
     def edit_client_action(self, content):
         if not content.nom_field.text:
             toast("Le nom du client est requis.")
@@ -690,6 +855,7 @@ class MainApp(MDApp):
         )
         self.dialog.open()
 
+    @action_protegee
     def delete_client_action(self, *args):
         database.supprimer_client(self.selected_item['id'])
         self.update_client_list()
@@ -706,6 +872,7 @@ class MainApp(MDApp):
         self.dialog.on_dismiss = content_cls.on_dismiss
         self.dialog.open()
 
+    @action_protegee
     def add_user_action(self, content):
         username = content.username_field.text
         password = content.password_field.text
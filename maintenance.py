@@ -0,0 +1,153 @@
+import argparse
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import database
+
+# --- Constantes ---
+DOSSIER_SAUVEGARDES = os.environ.get('GESTION_VENTES_SAUVEGARDES', 'sauvegardes')
+NB_SAUVEGARDES_CONSERVEES = 14
+INTERVALLE_SAUVEGARDE = 6 * 3600     # secondes entre deux sauvegardes
+INTERVALLE_ENTRETIEN = 24 * 3600     # secondes entre deux optimize / vacuum
+DELAI_INACTIVITE = 120               # secondes sans activité avant de lancer l'entretien
+PERIODE_VERIFICATION = 60            # secondes entre deux réveils du planificateur
+PAGES_PAR_ETAPE = 256                # pages copiées par étape de sauvegarde (hors WAL)
+PAUSE_ENTRE_ETAPES = 0.05            # secondes laissées aux caisses entre deux étapes
+PAGES_VACUUM_PAR_ENTRETIEN = 2000
+LIMITE_ANALYSE = 1000                # lignes lues par index par ANALYZE, pour garder le verrou peu de temps
+
+logger = logging.getLogger(__name__)
+
+# --- Sauvegarde ---
+def _prefixe_sauvegarde():
+    return os.path.splitext(os.path.basename(database.DB_PATH))[0] + '-'
+
+def lister_sauvegardes(dossier=DOSSIER_SAUVEGARDES):
+    """Sauvegardes existantes, de la plus ancienne à la plus récente."""
+    return sorted(glob.glob(os.path.join(dossier, _prefixe_sauvegarde() + '*.db')))
+
+def sauvegarder(dossier=DOSSIER_SAUVEGARDES, conservation=NB_SAUVEGARDES_CONSERVEES):
+    """
+    Sauvegarde à chaud avec l'API backup de SQLite, puis supprime les sauvegardes les plus anciennes.
+    En mode WAL, la copie lit un instantané sans bloquer les écritures ; sinon elle avance par
+    petites étapes pour que les caisses puissent valider leurs ventes entre deux étapes.
+    """
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, _prefixe_sauvegarde() + datetime.now().strftime('%Y%m%d-%H%M%S') + '.db')
+    temporaire = chemin + '.tmp'
+    source = sqlite3.connect(database.DB_PATH)
+    destination = sqlite3.connect(temporaire)
+    try:
+        mode_wal = source.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        if mode_wal:
+            source.backup(destination)
+        else:
+            # sleep= ne joue qu'après un SQLITE_BUSY : la pause entre deux étapes réussies se fait
+            # dans le rappel de progression, appelé après chaque étape, verrou de lecture relâché.
+            source.backup(destination, pages=PAGES_PAR_ETAPE,
+                          progress=lambda statut, restantes, total: time.sleep(PAUSE_ENTRE_ETAPES))
+    except sqlite3.Error:
+        destination.close()
+        os.remove(temporaire)
+        raise
+    finally:
+        destination.close()
+        source.close()
+    os.replace(temporaire, chemin)
+
+    for ancienne in lister_sauvegardes(dossier)[:-conservation]:
+        os.remove(ancienne)
+    return chemin
+
+# --- Entretien ---
+def entretenir(pages_vacuum=PAGES_VACUUM_PAR_ENTRETIEN):
+    """
+    Met à jour les statistiques du planificateur et rend au disque un nombre limité de pages
+    libérées. Chaque étape ne bloque les autres caisses que brièvement ; le vacuum n'a lieu
+    que si la base a été convertie par activer_vacuum_incremental().
+    """
+    conn = sqlite3.connect(database.DB_PATH, isolation_level=None)
+    try:
+        conn.execute(f"PRAGMA analysis_limit = {LIMITE_ANALYSE}")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+            conn.execute("PRAGMA optimize")
+        else:
+            conn.execute("ANALYZE")
+
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2 and conn.execute("PRAGMA freelist_count").fetchone()[0]:
+            # execute() n'exécute qu'un pas du pragma (une page) ; executescript() va jusqu'au bout.
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages_vacuum)})")
+    finally:
+        conn.close()
+
+def activer_vacuum_incremental():
+    """
+    Conversion unique en auto_vacuum INCREMENTAL. Elle impose un VACUUM complet qui bloque
+    toutes les écritures pendant la réécriture du fichier : à lancer caisses fermées.
+    Retourne False si la base était déjà convertie.
+    """
+    conn = sqlite3.connect(database.DB_PATH, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+class PlanificateurMaintenance(threading.Thread):
+    """
+    Thread de fond qui sauvegarde la base à intervalle régulier et lance l'entretien
+    seulement quand la caisse est inactive depuis DELAI_INACTIVITE secondes.
+    """
+    def __init__(self, dossier=DOSSIER_SAUVEGARDES):
+        super().__init__(name='maintenance', daemon=True)
+        self.dossier = dossier
+        self.derniere_activite = time.monotonic()
+        self.dernier_entretien = None
+        self._arret = threading.Event()
+        sauvegardes = lister_sauvegardes(dossier)
+        age = time.time() - os.path.getmtime(sauvegardes[-1]) if sauvegardes else INTERVALLE_SAUVEGARDE
+        self.derniere_sauvegarde = time.monotonic() - age
+
+    def signaler_activite(self):
+        """À appeler à chaque action de caisse (panier, vente, fiche modifiée) : repousse l'entretien."""
+        self.derniere_activite = time.monotonic()
+
+    def arreter(self):
+        self._arret.set()
+
+    def run(self):
+        while not self._arret.wait(PERIODE_VERIFICATION):
+            maintenant = time.monotonic()
+            try:
+                if maintenant - self.derniere_sauvegarde >= INTERVALLE_SAUVEGARDE:
+                    logger.info("Maintenance: sauvegarde dans %s", sauvegarder(self.dossier))
+                    self.derniere_sauvegarde = maintenant
+                inactif = maintenant - self.derniere_activite >= DELAI_INACTIVITE
+                du = self.dernier_entretien is None or maintenant - self.dernier_entretien >= INTERVALLE_ENTRETIEN
+                if inactif and du:
+                    entretenir()
+                    self.dernier_entretien = maintenant
+                    logger.info("Maintenance: entretien de la base terminé")
+            except (sqlite3.Error, OSError) as e:
+                # Base occupée par une autre caisse ou disque indisponible : on réessaiera au prochain réveil.
+                logger.warning("Maintenance: %s", e)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sauvegarde et entretien de la base des ventes.")
+    parser.add_argument('action', choices=['sauvegarde', 'entretien', 'vacuum-incremental'],
+                        help="vacuum-incremental : conversion unique, caisses fermées")
+    args = parser.parse_args()
+    if args.action == 'sauvegarde':
+        print(sauvegarder())
+    elif args.action == 'vacuum-incremental':
+        print("Base convertie." if activer_vacuum_incremental() else "Base déjà en vacuum incrémental.")
+    else:
+        entretenir()
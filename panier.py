@@ -0,0 +1,108 @@
+import database
+
+class LignePanier:
+    """Une ligne du panier : un produit, sa quantité et le prix appliqué."""
+    def __init__(self, produit):
+        self.produit_id = produit['id']
+        self.nom = produit['nom']
+        self.prix_catalogue = produit['prix_vente']
+        self.prix_force = None  # prix unitaire saisi à la main, remplace le prix catalogue
+        self.remise = 0.0       # remise en pourcentage, appliquée après le prix forcé
+        self.quantite = 0
+
+    @property
+    def prix_unitaire(self):
+        prix = self.prix_catalogue if self.prix_force is None else self.prix_force
+        return round(prix * (1 - self.remise / 100), 2)
+
+    @property
+    def sous_total(self):
+        return round(self.prix_unitaire * self.quantite, 2)
+
+class Panier:
+    """
+    Panier indexé par id produit : un produit ajouté deux fois ne fait qu'une ligne.
+    Le total est tenu à jour à chaque modification et `on_change(action, ligne)` est
+    appelé avec action = 'ajout', 'modification' ou 'suppression' (ligne = None pour 'vidage').
+    """
+    def __init__(self, on_change=None):
+        self.lignes = {}  # produit_id -> LignePanier, dans l'ordre d'ajout
+        self.total = 0.0
+        self.on_change = on_change
+
+    def __len__(self):
+        return len(self.lignes)
+
+    def __iter__(self):
+        return iter(self.lignes.values())
+
+    def _notifier(self, action, ligne):
+        if self.on_change:
+            self.on_change(action, ligne)
+
+    def _modifier(self, ligne, **valeurs):
+        ancien = ligne.sous_total
+        for nom, valeur in valeurs.items():
+            setattr(ligne, nom, valeur)
+        self.total = round(self.total + ligne.sous_total - ancien, 2)
+
+    def stock_disponible(self, produit_id):
+        """Stock actuel en base (et non celui lu lors de la recherche)."""
+        conn = database.get_db_connection()
+        row = conn.execute("SELECT quantite_stock FROM Produits WHERE id = ?", (produit_id,)).fetchone()
+        conn.close()
+        return row['quantite_stock'] if row else 0
+
+    def ajouter(self, produit, quantite=1):
+        """Ajoute une quantité d'un produit. Retourne False si le stock ne suffit pas."""
+        if quantite <= 0: return False
+        ligne = self.lignes.get(produit['id'])
+        deja = ligne.quantite if ligne else 0
+        if deja + quantite > self.stock_disponible(produit['id']):
+            return False
+        action = 'modification' if ligne else 'ajout'
+        if ligne is None:
+            ligne = self.lignes[produit['id']] = LignePanier(produit)
+        self._modifier(ligne, quantite=deja + quantite)
+        self._notifier(action, ligne)
+        return True
+
+    def modifier_quantite(self, produit_id, quantite):
+        """Fixe la quantité d'une ligne (0 la retire). Retourne False si le stock ne suffit pas."""
+        ligne = self.lignes.get(produit_id)
+        if ligne is None: return False
+        if quantite <= 0:
+            self.retirer(produit_id)
+            return True
+        if quantite > ligne.quantite and quantite > self.stock_disponible(produit_id):
+            return False
+        self._modifier(ligne, quantite=quantite)
+        self._notifier('modification', ligne)
+        return True
+
+    def definir_prix(self, produit_id, prix):
+        """Force le prix unitaire d'une ligne ; None rétablit le prix catalogue."""
+        ligne = self.lignes.get(produit_id)
+        if ligne is None or (prix is not None and prix < 0): return False
+        self._modifier(ligne, prix_force=prix)
+        self._notifier('modification', ligne)
+        return True
+
+    def definir_remise(self, produit_id, pourcentage):
+        """Applique une remise en pourcentage (0 à 100) sur une ligne."""
+        ligne = self.lignes.get(produit_id)
+        if ligne is None or not 0 <= pourcentage <= 100: return False
+        self._modifier(ligne, remise=pourcentage)
+        self._notifier('modification', ligne)
+        return True
+
+    def retirer(self, produit_id):
+        ligne = self.lignes.pop(produit_id, None)
+        if ligne is None: return
+        self.total = round(self.total - ligne.sous_total, 2)
+        self._notifier('suppression', ligne)
+
+    def vider(self):
+        self.lignes.clear()
+        self.total = 0.0
+        self._notifier('vidage', None)
@@ -0,0 +1,219 @@
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date
+
+import bcrypt
+
+import database
+from panier import Panier
+
+# --- Constantes ---
+NB_CAISSES = 4
+DUREE = 30                  # secondes de charge
+NB_PRODUITS_SYNTHETIQUES = 50
+# Répartition des opérations d'une caisse : vente, recherche, rapport
+POIDS_OPERATIONS = {'vente': 6, 'recherche': 3, 'rapport': 1}
+PERCENTILES = (50, 95, 99)
+
+# --- Préparation de la base ---
+def preparer_base(source, dossier, nb_caisses, stock=None):
+    """
+    Copie la base source (ou crée une base de produits synthétiques) dans `dossier`,
+    crée un vendeur par caisse et retourne (chemin, état initial).
+    """
+    chemin = os.path.join(dossier, 'stress.db')
+    if source and os.path.exists(source):
+        with sqlite3.connect(source) as src, sqlite3.connect(chemin) as dst:
+            src.backup(dst)
+    database.DB_PATH = chemin
+    database.initialiser_db()
+
+    conn = sqlite3.connect(chemin)
+    if not conn.execute("SELECT 1 FROM Produits LIMIT 1").fetchone():
+        conn.executemany("INSERT INTO Produits (id, nom, prix_achat, prix_vente, quantite_stock) VALUES (?, ?, ?, ?, ?)",
+                         [(f"STRESS-{i:03d}", f"Produit {i:03d}", 100.0 + i, 150.0 + i * 1.5, 200)
+                          for i in range(NB_PRODUITS_SYNTHETIQUES)])
+    if stock is not None:
+        conn.execute("UPDATE Produits SET quantite_stock = ?", (stock,))
+    mot_de_passe = bcrypt.hashpw(os.urandom(16), bcrypt.gensalt(rounds=4))
+    conn.executemany("INSERT OR IGNORE INTO Utilisateurs (username, password, role) VALUES (?, ?, 'vendeur')",
+                     [(f"caisse_{i}", mot_de_passe) for i in range(nb_caisses)])
+    conn.commit()
+    etat = {
+        'stock': dict(conn.execute("SELECT id, quantite_stock FROM Produits")),
+        'dernier_id_vente': conn.execute("SELECT COALESCE(MAX(id), 0) FROM Ventes").fetchone()[0],
+    }
+    conn.close()
+    return chemin, etat
+
+# --- Caisse simulée ---
+def _chronometrer(durees, nom, fonction, *args):
+    debut = time.perf_counter()
+    try:
+        return fonction(*args)
+    finally:
+        durees.setdefault(nom, []).append(time.perf_counter() - debut)
+
+def _vendre(durees, panier):
+    """
+    Enregistre la vente en chronométrant à part l'attente du verrou d'écriture (BEGIN IMMEDIATE)
+    et le travail fait sous verrou.
+    """
+    conn = database.get_db_connection()
+    try:
+        debut = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        finally:
+            durees.setdefault('verrou_vente', []).append(time.perf_counter() - debut)
+        return _chronometrer(durees, 'vente', database.enregistrer_vente, panier, None, conn)
+    finally:
+        conn.close()
+
+def caisse(numero, chemin, debut, duree, graine):
+    """Processus d'une caisse : enchaîne ventes, recherches et rapports jusqu'à la fin du test."""
+    database.DB_PATH = chemin
+    rng = random.Random(graine)
+    conn = database.get_db_connection()
+    vendeur = conn.execute("SELECT * FROM Utilisateurs WHERE username = ?", (f"caisse_{numero}",)).fetchone()
+    codes = [row['id'] for row in conn.execute("SELECT id FROM Produits")]
+    noms = [row['nom'] for row in conn.execute("SELECT nom FROM Produits")]
+    conn.close()
+    database.ouvrir_session(vendeur)
+
+    operations, poids = zip(*POIDS_OPERATIONS.items())
+    durees = {}
+    resultat = {'caisse': numero, 'ventes': 0, 'ventes_refusees': 0, 'verrous': 0, 'operations': 0}
+
+    time.sleep(max(0, debut - time.time()))  # toutes les caisses démarrent ensemble
+    fin = debut + duree
+    while time.time() < fin:
+        operation = rng.choices(operations, poids)[0]
+        try:
+            if operation == 'vente':
+                panier = Panier()
+                for code in rng.sample(codes, min(len(codes), rng.randint(1, 4))):
+                    produit = _chronometrer(durees, 'scan', database.trouver_produit_par_code, code)
+                    panier.ajouter(produit, rng.randint(1, 3))
+                if not len(panier):
+                    resultat['ventes_refusees'] += 1
+                elif _vendre(durees, panier) is None:
+                    resultat['ventes_refusees'] += 1
+                else:
+                    resultat['ventes'] += 1
+            elif operation == 'recherche':
+                terme = rng.choice(noms)[:rng.randint(1, 4)]
+                _chronometrer(durees, 'recherche', database.lister_produits_en_stock, terme)
+            else:
+                _chronometrer(durees, 'rapport_ca', database.get_total_revenue)
+                _chronometrer(durees, 'rapport_meilleures', database.get_best_selling_products)
+                _chronometrer(durees, 'rapport_vendeurs', database.get_ventes_par_vendeur, date.today(), date.today())
+            resultat['operations'] += 1
+        except sqlite3.OperationalError as e:
+            # "database is locked" : le délai d'attente du verrou est dépassé.
+            if 'locked' not in str(e):
+                raise
+            resultat['verrous'] += 1
+    resultat['durees'] = durees
+    return resultat
+
+# --- Vérifications ---
+def verifier_invariants(chemin, etat, resultats):
+    """Retourne la liste des invariants violés (vide si tout est cohérent)."""
+    conn = sqlite3.connect(chemin)
+    depart = etat['dernier_id_vente']
+    erreurs = []
+
+    negatifs = conn.execute("SELECT id, quantite_stock FROM Produits WHERE quantite_stock < 0").fetchall()
+    if negatifs:
+        erreurs.append(f"{len(negatifs)} produit(s) en stock négatif, ex. {negatifs[0]}")
+
+    incoherentes = conn.execute("""
+        SELECT V.id, V.total, TOTAL(DV.quantite * DV.prix_unitaire)
+        FROM Ventes V LEFT JOIN Details_Vente DV ON DV.vente_id = V.id
+        WHERE V.id > ?
+        GROUP BY V.id
+        HAVING ABS(V.total - TOTAL(DV.quantite * DV.prix_unitaire)) > 0.005 OR COUNT(DV.id) = 0
+    """, (depart,)).fetchall()
+    if incoherentes:
+        erreurs.append(f"{len(incoherentes)} vente(s) dont le total diffère de la somme des lignes, ex. {incoherentes[0]}")
+
+    vendues = dict(conn.execute("""
+        SELECT DV.produit_id, SUM(DV.quantite) FROM Details_Vente DV
+        JOIN Ventes V ON DV.vente_id = V.id WHERE V.id > ? GROUP BY DV.produit_id
+    """, (depart,)))
+    for produit_id, stock_final in conn.execute("SELECT id, quantite_stock FROM Produits"):
+        attendu = etat['stock'].get(produit_id, 0) - vendues.get(produit_id, 0)
+        if stock_final != attendu:
+            erreurs.append(f"Stock de {produit_id} : {stock_final} en base, {attendu} attendu (mise à jour perdue)")
+
+    enregistrees = conn.execute("SELECT COUNT(*) FROM Ventes WHERE id > ?", (depart,)).fetchone()[0]
+    annoncees = sum(r['ventes'] for r in resultats)
+    if enregistrees != annoncees:
+        erreurs.append(f"{enregistrees} ventes en base pour {annoncees} validées par les caisses")
+    conn.close()
+    return erreurs
+
+# --- Rapport ---
+def _percentile(valeurs, p):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))]
+
+def afficher_rapport(resultats, duree, erreurs):
+    ventes = sum(r['ventes'] for r in resultats)
+    operations = sum(r['operations'] for r in resultats)
+    print(f"\n{len(resultats)} caisses pendant {duree:.0f} s")
+    print(f"Débit : {ventes / duree:.1f} ventes/s, {operations / duree:.1f} opérations/s")
+    print(f"Ventes : {ventes} validées, {sum(r['ventes_refusees'] for r in resultats)} refusées (stock), "
+          f"{sum(r['verrous'] for r in resultats)} échecs 'database is locked'")
+
+    durees = {}
+    for r in resultats:
+        for nom, valeurs in r['durees'].items():
+            durees.setdefault(nom, []).extend(valeurs)
+    print("\nLatences (ms) ; verrou_vente = attente du verrou d'écriture, vente = travail sous verrou :")
+    print(f"  {'opération':<18} {'n':>7} " + " ".join(f"{'p' + str(p):>8}" for p in PERCENTILES) + f" {'max':>8}")
+    for nom, valeurs in sorted(durees.items()):
+        colonnes = " ".join(f"{_percentile(valeurs, p) * 1000:8.1f}" for p in PERCENTILES)
+        print(f"  {nom:<18} {len(valeurs):>7} {colonnes} {max(valeurs) * 1000:8.1f}")
+
+    print("\nInvariants :", "OK" if not erreurs else "ÉCHEC")
+    for erreur in erreurs:
+        print("  -", erreur)
+
+def lancer(nb_caisses=NB_CAISSES, duree=DUREE, source=None, stock=None, dossier=None, graine=0):
+    """Lance le test de charge et retourne (résultats par caisse, invariants violés)."""
+    chemin, etat = preparer_base(source, dossier, nb_caisses, stock)
+    contexte = multiprocessing.get_context('spawn')  # de vrais processus indépendants, comme des caisses
+    debut = time.time() + 2  # laisse le temps aux processus de démarrer
+    with contexte.Pool(nb_caisses) as pool:
+        resultats = pool.starmap(caisse, [(i, chemin, debut, duree, graine + i) for i in range(nb_caisses)])
+    return resultats, verifier_invariants(chemin, etat, resultats)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simule plusieurs caisses écrivant en même temps dans la même base.")
+    parser.add_argument('--caisses', type=int, default=NB_CAISSES)
+    parser.add_argument('--duree', type=float, default=DUREE, help="secondes de charge")
+    parser.add_argument('--source', default=database.DB_PATH, help="base copiée pour le test (jamais modifiée)")
+    parser.add_argument('--stock', type=int, help="stock initial imposé à tous les produits (faible = plus de conflits)")
+    parser.add_argument('--graine', type=int, default=0)
+    parser.add_argument('--garder', action='store_true', help="conserver la base du test")
+    args = parser.parse_args()
+
+    dossier = tempfile.mkdtemp(prefix='stress_ventes_')
+    try:
+        resultats, erreurs = lancer(args.caisses, args.duree, args.source, args.stock, dossier, args.graine)
+        afficher_rapport(resultats, args.duree, erreurs)
+    finally:
+        if args.garder:
+            print(f"\nBase du test : {os.path.join(dossier, 'stress.db')}")
+        else:
+            shutil.rmtree(dossier)
+    sys.exit(1 if erreurs else 0)